@@ -1,9 +1,11 @@
 import torch
-import torch.nn as nn
 import numpy as np
 import argparse
+import os
+import time
 from tqdm import tqdm
-import pandas as pd
+from sdgd import LAPLACIAN_ENGINES, laplacian, laplacian_value, hessian_diag_param_grads, check_hessian_engine, MLP, TwoBodyPoissonSampler, PrefetchSampler
+from sdgd import Evaluator, scratch_dir, cached_test_set, MetricsWriter, METRICS_FIELDS, SAGATable, Checkpointer, rng_state, set_rng_state, PhaseProfiler, phase
 import copy
 
 parser = argparse.ArgumentParser(description='PINN Training')
@@ -23,7 +25,39 @@ parser.add_argument('--N_test', type=int, default=int(20000)) # num of test poin
 parser.add_argument('--x_radius', type=float, default=1)
 parser.add_argument('--method', type=int, default=3)
 parser.add_argument('--batch_size', type=int, default=1)
+parser.add_argument('--hessian_engine', type=str, default='loop', choices=LAPLACIAN_ENGINES) # how d2u/dxi2 is computed
+parser.add_argument('--engine_check_dims', type=int, default=8) # random dimensions of the startup check of --hessian_engine against the loop engine (0: skip)
+parser.add_argument('--resample_backend', type=str, default='numpy', choices=['numpy', 'torch']) # where collocation points and forcing are generated
+parser.add_argument('--prefetch_workers', type=int, default=0) # background collocation workers (0: resample synchronously)
+parser.add_argument('--prefetch_depth', type=int, default=4) # max number of batches kept ready
+parser.add_argument('--eval_every', type=int, default=1) # epochs between two full test evaluations
+parser.add_argument('--eval_chunk', type=int, default=4096) # test points per evaluation chunk
+parser.add_argument('--eval_subsample', type=int, default=0) # test points of the rolling estimate between full evaluations (0: off)
+parser.add_argument('--test_mmap', type=int, default=0) # keep the test set in a memory map and stream it?
+parser.add_argument('--test_cache', type=str, default='') # directory of the test sets shared across runs, streamed from disk (empty: regenerate)
+parser.add_argument('--saga_storage', type=str, default='float32', choices=['float32', 'float16', 'bfloat16']) # dtype of the SAGA table
+parser.add_argument('--saga_memmap', type=str, default='') # file backing the SAGA table when it does not fit in RAM
+parser.add_argument('--saga_update', type=str, default=None, choices=['batched', 'first']) # update every sampled slot (default), or only idx[0] as before
+parser.add_argument('--vr', type=str, default='saga', choices=['saga', 'svrg']) # variance reduction, svrg needs O(params) memory only
+parser.add_argument('--svrg_interval', type=int, default=100) # epochs between two SVRG snapshots
+parser.add_argument('--svrg_N_f', type=int, default=int(1000)) # num of anchor points of the full-Laplacian SVRG gradient
+parser.add_argument('--svrg_chunk', type=int, default=64) # dimensions per backward pass of the SVRG anchor gradient, bounds its memory
+parser.add_argument('--profile', type=int, default=0) # time every phase of the training step and report the peak memory?
+parser.add_argument('--profile_trace_start', type=int, default=10) # first epoch of the torch.profiler trace
+parser.add_argument('--profile_trace_steps', type=int, default=0) # epochs in the torch.profiler trace (0: no trace)
+parser.add_argument('--ckpt_every', type=int, default=0) # epochs between two checkpoints (0: off)
+parser.add_argument('--ckpt_path', type=str, default='') # checkpoint file, checkpoints/<run name>.pt if empty
+parser.add_argument('--resume', type=int, default=0) # continue from the checkpoint if there is one?
 args = parser.parse_args()
+if args.vr == "svrg" and args.method not in [0, 4]:
+    parser.error("--vr svrg needs an estimator whose gradient is unbiased for the full-Laplacian anchor: --method 4 (or 0), "
+                 "the gradient of the squared method 3 residual is biased")
+if args.vr == "svrg" and args.saga_update is not None:
+    parser.error("--saga_update only applies to --vr saga")
+if args.vr == "saga" and args.saga_update is None:
+    args.saga_update = "batched"
+if args.vr == "svrg" and args.Name == "SADGD_PINN":
+    args.Name = "SVRG_PINN"
 print(args)
 
 device = torch.device(args.device)
@@ -34,9 +68,9 @@ assert args.dataset == "Poisson"
 
 c = np.random.randn(1, args.dim - 1)
 const_2 = 1
-def load_data_TwoBody_Poisson(d):
-    args.input_dim = d
-    args.output_dim = 1
+args.input_dim = args.dim
+args.output_dim = 1
+def load_data_TwoBody_Poisson(d, directory=None, chunk_size=65536):
     def func_u(x):
         temp =  args.x_radius**2 - np.sum(x**2, 1)
         temp2 = c * np.sin(x[:, :-1] + const_2 * np.cos(x[:, 1:]) + x[:, 1:] * np.cos(x[:, :-1]))
@@ -45,59 +79,130 @@ def load_data_TwoBody_Poisson(d):
 
     N_test = args.N_test
 
-    x = np.random.randn(N_test, d)
-    r = np.random.rand(N_test, 1) * args.x_radius
-    x = x / np.linalg.norm(x, axis=1, keepdims=True) * r
-    u = func_u(x)
-    return x, u
+    if directory is None:
+        x = np.random.randn(N_test, d)
+        r = np.random.rand(N_test, 1) * args.x_radius
+        x = x / np.linalg.norm(x, axis=1, keepdims=True) * r
+        u = func_u(x)
+        return x, u
 
-x, u = load_data_TwoBody_Poisson(d=args.dim)
+    # the same draws, written chunk by chunk to x.npy and u.npy in directory so that
+    # the test set never sits in memory
+    x = np.lib.format.open_memmap(os.path.join(directory, "x.npy"), mode="w+", shape=(N_test, d))
+    u = np.lib.format.open_memmap(os.path.join(directory, "u.npy"), mode="w+", shape=(N_test,))
+    for start in range(0, N_test, chunk_size):
+        x[start:start + chunk_size] = np.random.randn(min(chunk_size, N_test - start), d)
+    for start in range(0, N_test, chunk_size):
+        r = np.random.rand(min(chunk_size, N_test - start), 1) * args.x_radius
+        chunk = x[start:start + chunk_size]
+        chunk = chunk / np.linalg.norm(chunk, axis=1, keepdims=True) * r
+        x[start:start + chunk_size] = chunk
+        u[start:start + chunk_size] = func_u(chunk)
+    x.flush()
+    u.flush()
+    return np.load(os.path.join(directory, "x.npy"), mmap_mode="r"), np.load(os.path.join(directory, "u.npy"), mmap_mode="r")
+
+if args.test_cache: # a hit loads the memory maps written by an earlier run with the same test set
+    x, u = cached_test_set(
+        lambda directory: load_data_TwoBody_Poisson(args.dim, directory), args.test_cache,
+        dim=args.dim, N_test=args.N_test, SEED=args.SEED, x_radius=args.x_radius, const_2=const_2
+    )
+elif args.test_mmap: # keep the test set on disk, in a directory removed at exit, and stream it during evaluation
+    x, u = load_data_TwoBody_Poisson(args.dim, scratch_dir())
+else:
+    x, u = load_data_TwoBody_Poisson(d=args.dim)
 print(x.shape, u.shape)
 print(u.mean(), u.std())
 
-def initialize_para(nn, val):
-    for para in nn.parameters():
-        para.data.fill_(val)
-    return nn
-    
-class MLP(nn.Module):
-    def __init__(self, layers:list):
-        super(MLP, self).__init__()
-        models = []
-        for i in range(len(layers)-1):
-            models.append(nn.Linear(layers[i], layers[i+1]))
-            if i != len(layers)-2:
-                models.append(nn.Tanh())
-        self.nn = nn.Sequential(*models)
-    def forward(self, x):
-        return ((1 - torch.sum(x**2, 1, keepdims=True)) * self.nn(x))
-
 class PINN:
     def __init__(self):
         self.epoch = args.epochs
         self.adam_lr = args.lr
         self.dim, self.batch_size = args.dim, args.batch_size
-        self.x = torch.tensor(x, dtype=torch.float32, requires_grad=False).to(device)
-        self.u = torch.tensor(u, dtype=torch.float32, requires_grad=False).to(device).reshape(-1)
         # Initalize Neural Networks
         layers = [args.input_dim] + [args.PINN_h] * (args.PINN_L - 1) + [args.output_dim]
 
         self.u_net = MLP(layers).to(device)
+        self.evaluator = Evaluator(self.u_net, x, u, chunk_size=args.eval_chunk, subsample=args.eval_subsample, device=device, seed=args.SEED)
 
         self.net_params_pinn = list(self.u_net.parameters())
-        self.saved_loss = []
-        self.saved_l2 = []
+        self.sampler = TwoBodyPoissonSampler(c, args.N_f, args.x_radius, const_2, device=device, seed=args.SEED)
+        if args.prefetch_workers > 0:
+            self.pipeline = self.make_pipeline()
+        if args.vr == "svrg": # independent stream for the anchor batches
+            self.anchor_sampler = TwoBodyPoissonSampler(c, args.svrg_N_f, args.x_radius, const_2, device=device, seed=args.SEED + 1)
+
+        if args.hessian_engine != "loop" and args.engine_check_dims > 0: # check the batched engine against the autograd loop
+            # a few dimensions on a few points, from a private stream: the full check would cost dim x dim HVPs
+            check_idx = np.random.RandomState(args.SEED).choice(self.dim, min(self.dim, args.engine_check_dims), replace=False)
+            err = check_hessian_engine(self.u_net, torch.tensor(x[:16], dtype=torch.float32).to(device), check_idx, args.hessian_engine)
+            print("Hessian engine %s, max abs err vs loop: %e" % (args.hessian_engine, err))
         #self.saved_d2f_dxidxi = torch.zeros(args.dim,args.N_f).to(device)
         #self.residual_pred = 0
+
+    def make_pipeline(self, start=0): # workers sample on the CPU and hand batches over to device
+        return PrefetchSampler(
+            lambda: TwoBodyPoissonSampler(c, args.N_f, args.x_radius, const_2, device="cpu"),
+            num_workers=args.prefetch_workers, depth=args.prefetch_depth, seed=args.SEED, device=device, start=start
+        )
         
     def num_params(self):
         num_pinn = 0
         for p in self.net_params_pinn:
             num_pinn += len(p.reshape(-1))
         return num_pinn
+
+    def checkpoint_path(self):
+        return args.ckpt_path or os.path.join("checkpoints", os.path.splitext(os.path.basename(self.metrics_path()))[0] + ".pt")
+
+    def checkpoint_state(self, epoch, elapsed, optimizer, scheduler, **extra): # everything a bit-for-bit resume needs, extra holds the SAGA or SVRG state
+        return {
+            "epoch": epoch,
+            "elapsed": elapsed,
+            "net": self.u_net.state_dict(),
+            "optimizer": optimizer.state_dict(),
+            "scheduler": scheduler.state_dict(),
+            "rng": rng_state(),
+            "sampler": self.sampler.generator.get_state(),
+            "anchor_sampler": self.anchor_sampler.generator.get_state() if args.vr == "svrg" else None,
+            "pipeline": self.pipeline.batch_index if args.prefetch_workers > 0 else 0,
+            "evaluator": self.evaluator.generator.bit_generator.state,
+            "c": c,
+            "metrics_rows": self.metrics.rows if hasattr(self, "metrics") else 0,
+            **extra,
+        }
+
+    def load_checkpoint_state(self, state, optimizer, scheduler):
+        if not np.array_equal(state["c"], c):
+            raise ValueError("%s was written for other problem coefficients, check --SEED and --dim" % self.checkpoint_path())
+        self.u_net.load_state_dict(state["net"])
+        optimizer.load_state_dict(state["optimizer"])
+        scheduler.load_state_dict(state["scheduler"])
+        set_rng_state(state["rng"])
+        self.sampler.generator.set_state(state["sampler"])
+        if args.vr == "svrg":
+            self.anchor_sampler.generator.set_state(state["anchor_sampler"])
+        if args.prefetch_workers > 0: # restart the workers at the next batch of the interrupted run
+            self.pipeline.close()
+            self.pipeline = self.make_pipeline(state["pipeline"])
+        self.evaluator.generator.bit_generator.state = state["evaluator"]
+
+    def profile_path(self, suffix): # next to the metrics file
+        return os.path.splitext(self.metrics_path())[0] + suffix
+
+    def metrics_path(self): # convert to .xlsx offline with python -m sdgd.metrics
+        return "saved_loss_l2/"+args.Name+"_"+args.dataset+"_dim="+str(args.dim)+\
+            "_batch="+str(args.batch_size)+"_N_f="+str(args.N_f)\
+            +"_method="+str(args.method)+"_SEED="+str(args.SEED)+"_Num_params="+str(self.num_params())+".csv"
         
 
     def Resample(self): # sample random points at the begining of each iteration
+        if args.prefetch_workers > 0:
+            self.xf, self.ff = self.pipeline.next()
+            return
+        if args.resample_backend == "torch":
+            self.xf, self.ff = self.sampler.sample()
+            return
         N_f = args.N_f # Number of collocation points
 
         xf = np.random.randn(N_f, args.dim)
@@ -134,144 +239,216 @@ class PINN:
         self.ff = torch.tensor(ff, dtype=torch.float32, requires_grad=True).to(device)
         return
 
-    def Method0(self): # Vanilla PINN
+    def Method0(self, net=None): # Vanilla PINN
         x = self.xf
-        x.requires_grad_()
-        f = self.u_net(x)
-        u_x = torch.autograd.grad(f.sum(), x, create_graph=True)[0]
-
-        u_xx = []
-        for i in range(self.dim):
-            d2f_dxidxi = torch.autograd.grad(u_x[:, i].sum(), x, create_graph=True)[0][:, i:i+1]
-            u_xx.append(d2f_dxidxi)
-        # (batch_size, x_dim)
-        u_xx = torch.concat(u_xx, dim=1)
+        net = self.u_net if net is None else net
+        # (batch_size,)
+        u_lap = laplacian(net, x, range(self.dim), args.hessian_engine)
 
-        residual_pred = torch.sum(u_xx, dim=1) - self.ff
+        residual_pred = u_lap - self.ff
         loss = residual_pred.square().mean()
         saeved_loss = loss
         return loss, saeved_loss
     
     
-    def Method4(self): #SDGD Algorithm 3
+    def Method4(self, idx=None, net=None): # SDGD Algorithm 1: full residual in the forward pass, sampled dimensions in the backward pass
         x = self.xf
-        x.requires_grad_()
-        f = self.u_net(x)
-        u_x = torch.autograd.grad(f.sum(), x, create_graph=True)[0]
+        net = self.u_net if net is None else net
+        if idx is None:
+            idx = np.random.choice(self.dim, self.batch_size, replace=False)
+        # (batch_size,), no graph is built for the full residual
+        residual_pred = laplacian_value(net, x) - self.ff
+        u_lap = laplacian(net, x, idx, args.hessian_engine)
 
-        residual_pred = 0
-        idx = np.random.choice(self.dim, self.batch_size, replace=False)
-        for i in range(self.dim):
-            d2f_dxidxi = torch.autograd.grad(u_x[:, i].sum(), x, create_graph=True)[0][:, i]
-            if i in idx:
-                yet = d2f_dxidxi.detach().clone()
-                residual_pred += yet
-            else:
-                residual_pred += d2f_dxidxi
-        residual_pred = residual_pred * self.dim / self.batch_size - self.ff
-        loss = residual_pred.square().mean()
-        saeved_loss = loss
-        return loss, saeved_loss
-    
+        # gradient: 2 * mean(r * dim / batch_size * sum_{i in idx} d(d2u/dxi2)/dtheta)
+        loss = 2 * torch.mean(residual_pred * u_lap) * self.dim / self.batch_size
+        saeved_loss = residual_pred.square().mean()
+        return loss, saeved_loss, idx
     
-    def Method3(self): #SDGD Algorithm 3
+    def Method3(self, idx=None, net=None): #SDGD Algorithm 3
         x = self.xf
-        x.requires_grad_()
-        f = self.u_net(x)
-        u_x = torch.autograd.grad(f.sum(), x, create_graph=True)[0]
+        net = self.u_net if net is None else net
+        if idx is None:
+            idx = np.random.choice(self.dim, self.batch_size, replace=False)
+        # (batch_size,)
+        u_lap = laplacian(net, x, idx, args.hessian_engine)
 
-        residual_pred = 0
-        idx = np.random.choice(self.dim, self.batch_size, replace=False)
-        for i in idx:
-            d2f_dxidxi = torch.autograd.grad(u_x[:, i].sum(), x, create_graph=True)[0][:, i]
-            residual_pred += d2f_dxidxi
-
-        residual_pred = residual_pred * self.dim / self.batch_size - self.ff
+        residual_pred = u_lap * self.dim / self.batch_size - self.ff
         loss = residual_pred.square().mean()
         saeved_loss = loss
-        return loss, saeved_loss, idx[0]
-    
+        return loss, saeved_loss, idx
 
-    
+    def Method3_dims(self, full_residual=False): # SDGD Algorithm 3 (Algorithm 1 if full_residual) with one gradient per sampled dimension
+        if self.batch_size == 1: # the Method3/Method4 gradient is the only component, a plain backward is cheaper
+            loss, saeved_loss, idx = self.Method4() if full_residual else self.Method3()
+            grad_dims = torch.cat([g.reshape(1, -1) for g in torch.autograd.grad(loss, self.net_params_pinn)], dim=1)
+            return grad_dims, saeved_loss, idx
+        x = self.xf
+        idx = np.random.choice(self.dim, self.batch_size, replace=False)
+        # residual only, the graph is rebuilt per dimension below
+        if full_residual:
+            residual_pred = (laplacian_value(self.u_net, x) - self.ff).detach()
+        else:
+            # the loop engine differentiates through autograd, the other engines only need the value
+            with torch.set_grad_enabled(args.hessian_engine == "loop"):
+                u_lap = laplacian(self.u_net, x, idx, args.hessian_engine).detach()
+            residual_pred = (u_lap * self.dim / self.batch_size - self.ff).detach()
+        # SAGA component of dimension idx[j], their mean is the Method3/Method4 gradient
+        grad_dims = 2 * self.dim * hessian_diag_param_grads(self.u_net, x, idx, residual_pred)
+        saeved_loss = residual_pred.square().mean()
+        return grad_dims, saeved_loss, idx
+
+    def svrg_anchor(self): # SVRG snapshot of the network and its full-Laplacian (Method0) gradient on an anchor batch
+        snapshot = copy.deepcopy(self.u_net)
+        params = list(snapshot.parameters())
+        xf, ff = self.anchor_sampler.sample()
+        # (svrg_N_f,), no graph is built for the full residual
+        residual = laplacian_value(snapshot, xf) - ff
+        # grad of mean(residual^2) = sum over the chunks of grad 2 * mean(residual * chunk Laplacian),
+        # so only the graph of svrg_chunk dimensions is alive at a time
+        anchor_grad = [torch.zeros_like(p) for p in params]
+        for start in range(0, self.dim, args.svrg_chunk):
+            u_lap = laplacian(snapshot, xf, range(start, min(start + args.svrg_chunk, self.dim)), args.hessian_engine)
+            loss = 2 * torch.mean(residual * u_lap)
+            torch._foreach_add_(anchor_grad, torch.autograd.grad(loss, params))
+        return snapshot, tuple(anchor_grad)
 
     def train_adam(self):
         optimizer = torch.optim.Adam(self.net_params_pinn, lr=self.adam_lr)
         scheduler = torch.optim.lr_scheduler.ExponentialLR(optimizer, gamma=0.9995)
         lr_lambda = lambda epoch: 1-epoch/args.epochs
         scheduler = torch.optim.lr_scheduler.LambdaLR(optimizer, lr_lambda=lr_lambda)
-        L2, L1 = self.L2_pinn()
-        print('Initialization: l2: %e, l1: %e'%(L2, L1))
-        self.saved_loss.append(0)
-        self.saved_l2.append([L2, L1])
+        checkpointer = Checkpointer(self.checkpoint_path())
+        state = checkpointer.load("cpu") if args.resume else None
+        start_epoch, elapsed = 0, 0
+        if state is not None:
+            self.load_checkpoint_state(state, optimizer, scheduler)
+            start_epoch, elapsed = state["epoch"], state["elapsed"]
+            print('Resuming from epoch %d of %s'%(start_epoch, checkpointer.path))
+            if args.save_loss: # drop the rows logged after the checkpoint
+                self.metrics = MetricsWriter(self.metrics_path(), METRICS_FIELDS, keep_rows=state["metrics_rows"])
+        else:
+            L2, L1 = self.L2_pinn()
+            print('Initialization: l2: %e, l1: %e'%(L2, L1))
+            if args.save_loss: # one row per epoch, appended to disk while training
+                self.metrics = MetricsWriter(self.metrics_path(), METRICS_FIELDS)
+                self.metrics.log(epoch=0, time=0, L2=L2, L1=L1)
+        start_time = time.perf_counter() - elapsed
         
-        #mean_grad = self.initialize_para(copy.deepcopy(self.u_net), 0)
-        #prev_stoc_grad = [self.initialize_para(copy.deepcopy(self.u_net), 0) for i in range(args.dim)]#list of nets (one for each dimension)
-        mean_grad = initialize_para(copy.deepcopy(self.u_net), 0)#Simple net
-        prev_stoc_grad = [initialize_para(copy.deepcopy(self.u_net), 0) for i in range(args.dim)]#list of nets (one for each sample)
-        #print(prev_stoc_grad[0][0])
-        for n in tqdm(range(self.epoch)):
-            self.Resample()
-            if args.method == 0:
+        if args.vr == "saga":
+            # (dim, num_params) gradient table, the parameter grads are views of saga.flat_grad
+            saga = SAGATable(self.net_params_pinn, args.dim, args.saga_storage, args.saga_memmap or None)
+            if state is not None and args.saga_memmap: # the table was copied next to the checkpoint
+                saga.load_table(state["saga_table_path"])
+                saga.mean.copy_(state["saga_mean"])
+            elif state is not None:
+                saga.table.copy_(state["saga_table"])
+                saga.mean.copy_(state["saga_mean"])
+        elif state is not None and start_epoch % args.svrg_interval != 0: # the snapshot of the current interval
+            snapshot = copy.deepcopy(self.u_net)
+            snapshot.load_state_dict(state["svrg_snapshot"])
+            anchor_grad = tuple(g.to(device) for g in state["svrg_anchor_grad"])
+        profiler = PhaseProfiler(device, self.profile_path("_trace.json"), args.profile_trace_start, args.profile_trace_steps)
+        if args.profile:
+            profiler.start()
+        for n in tqdm(range(start_epoch, self.epoch)):
+            profiler.step(n)
+            start = time.perf_counter()
+            with phase("resample"):
+                self.Resample()
+            if args.vr == "svrg":
+                if n % args.svrg_interval == 0:
+                    with phase("svrg_anchor"):
+                        snapshot, anchor_grad = self.svrg_anchor()
+                if args.method == 4:
+                    loss, saved_loss, idx = self.Method4()
+                else:
+                    loss, saved_loss = self.Method0()
+            elif args.method == 0:
                 loss, saved_loss = self.Method0()
+            elif args.method in [3, 4] and args.saga_update == "batched":
+                grad_dims, saved_loss, idx = self.Method3_dims(full_residual=args.method == 4)
             elif args.method == 3:
                 loss, saved_loss,idx = self.Method3()
+            elif args.method == 4:
+                loss, saved_loss, idx = self.Method4()
             #print("yyet",idx)
             
-            optimizer.zero_grad()
-            
-            loss.backward()
-            
+            optimizer.zero_grad(set_to_none=False)
             
             # backprop
-            for para, para_prev, para_mean in zip(self.u_net.parameters(), prev_stoc_grad[idx].parameters(), mean_grad.parameters()):
-                saga_update = para.grad.data - para_prev.data + para_mean.data
-                para_mean.data += (1./args.dim) * (para.grad.data - para_prev.data) #update mean
-                para_prev.data = para.grad.data.clone() # update previous grad
-                para.grad = saga_update.clone()
+            if args.vr == "svrg": # control variate g(w) - g(w_snapshot) + anchor, the same estimator on the same points and dimensions
+                with phase("backward"):
+                    loss.backward()
+                snapshot_loss = (self.Method4(idx, snapshot) if args.method == 4 else self.Method0(snapshot))[0]
+                with phase("backward"):
+                    snapshot_grad = torch.autograd.grad(snapshot_loss, list(snapshot.parameters()))
+                with phase("svrg_update"):
+                    torch._foreach_add_([p.grad for p in self.net_params_pinn], torch._foreach_sub(anchor_grad, snapshot_grad))
+            elif args.saga_update == "batched": # per-dimension gradients come from Method3_dims
+                with phase("saga_update"):
+                    saga.step_batched(grad_dims, idx)
+            else:
+                with phase("backward"):
+                    loss.backward()
+                with phase("saga_update"):
+                    saga.step(idx[0])
             
             
             
-            optimizer.step()
+            with phase("optimizer"):
+                optimizer.step()
             
             
             if args.use_sch:
                 scheduler.step()
             current_loss = saved_loss.item()
+            step_time = time.perf_counter() - start
             
             
-            if n % 100 == 0:
+            # the console report every 100 epochs is a full evaluation too, so its row records it
+            evaluate = n % 100 == 0 or (args.save_loss and ((n + 1) % args.eval_every == 0 or n == self.epoch - 1))
+            if evaluate:
                 L2, L1 = self.L2_pinn()
+            if n % 100 == 0:
                 print('epoch %d, loss: %e, l2: %e, l1: %e'%(n, current_loss, L2, L1))
             if args.save_loss:
-                self.saved_loss.append(current_loss)
-                if n % 100 != 0:
-                    L2, L1 = self.L2_pinn()
-                self.saved_l2.append([L2, L1])
+                row = dict(epoch=n + 1, time=time.perf_counter() - start_time, step_time=step_time, loss=current_loss)
+                if evaluate:
+                    row.update(L2=L2, L1=L1)
+                elif args.eval_subsample > 0: # cheap estimate between full evaluations
+                    with phase("evaluation"):
+                        row["L2_est"], row["L1_est"] = self.evaluator.rolling()
+                self.metrics.log(**row)
+            if args.ckpt_every and (n + 1) % args.ckpt_every == 0:
+                if hasattr(self, "metrics"): # the rows up to the cursor must be on disk
+                    self.metrics.flush()
+                if args.vr == "saga" and args.saga_memmap: # copied on disk, a memmap table does not fit in memory
+                    saga.flush()
+                    extra = {"saga_table_path": checkpointer.attach(args.saga_memmap, n + 1), "saga_mean": saga.mean}
+                elif args.vr == "saga":
+                    extra = {"saga_table": saga.table, "saga_mean": saga.mean}
+                else:
+                    extra = {"svrg_snapshot": snapshot.state_dict(), "svrg_anchor_grad": anchor_grad}
+                # snapshot to CPU, written in the background
+                checkpointer.save(self.checkpoint_state(n + 1, time.perf_counter() - start_time, optimizer, scheduler, **extra))
+        if args.save_loss:
+            self.metrics.close()
+            print("Metrics written to", self.metrics.path)
+        checkpointer.wait()
+        profiler.stop()
+        if args.profile:
+            profiler.report(self.profile_path("_profile.csv"))
 
     def predict_pinn(self):
-        f = self.u_net(self.x).reshape(-1)
+        f = self.evaluator.predict()
         return f
     
     def L2_pinn(self):
-        pred_u = self.predict_pinn()
-        pred_u = self.u - pred_u
-        L2, L1 = torch.norm(pred_u) / torch.norm(self.u), \
-            torch.norm(pred_u, p=1) / torch.norm(self.u, 1)
-        L2, L1 = L2.item(), L1.item()
+        with phase("evaluation"):
+            L2, L1 = self.evaluator.full()
         return L2, L1
 
 model = PINN()
 print("Num params:", model.num_params())
 model.train_adam()
-
-if args.save_loss:
-    model.saved_loss = np.asarray(model.saved_loss)
-    model.saved_l2 = np.asarray(model.saved_l2)
-    info_dict = {"loss": model.saved_loss, "L2": model.saved_l2[:, 0], "L1": model.saved_l2[:, 1]}
-    df = pd.DataFrame(data=info_dict, index=None)
-    df.to_excel(
-        "saved_loss_l2/"+args.Name+"_"+args.dataset+"_dim="+str(args.dim)+\
-            "_batch="+str(args.batch_size)+"_N_f="+str(args.N_f)\
-            +"_method="+str(args.method)+"_SEED="+str(args.SEED)+"_Num_params="+str(model.num_params())+".xlsx",
-        index=False
-    )
@@ -1,16 +1,19 @@
 import torch
-import torch.nn as nn
 import numpy as np
 import argparse
+import os
+import time
 from tqdm import tqdm
-import pandas as pd
+from sdgd import HESSIAN_ENGINES, LAPLACIAN_ENGINES, PROBE_DISTRIBUTIONS, hessian_diag, laplacian, laplacian_value, sample_probes, hutchinson_laplacian, check_hessian_engine, MLP, TwoBodyPoissonSampler, DimensionSampler, PrefetchSampler
+from sdgd import Evaluator, scratch_dir, cached_test_set, MetricsWriter, METRICS_FIELDS, CompiledStep, PRECISIONS, PrecisionPolicy, Checkpointer, rng_state, set_rng_state, PhaseProfiler, phase
+from sdgd import init_distributed, shard, rank_seed, all_reduce_sum, GradAllReducer
 
 parser = argparse.ArgumentParser(description='SDGD_PINN Training')
 parser.add_argument('--Name', type=str, default='SDGD_PINN')
 parser.add_argument('--SEED', type=int, default=0)
 parser.add_argument('--dim', type=int, default=15) # dimension of the problem.
 parser.add_argument('--dataset', type=str, default="Poisson")
-parser.add_argument('--device', type=str, default="cuda")
+parser.add_argument('--device', type=str, default="cuda" if torch.cuda.is_available() else "cpu")
 parser.add_argument('--epochs', type=int, default=1000) # Adam epochs
 parser.add_argument('--lr', type=float, default=1e-3) # Adam lr
 parser.add_argument('--PINN_h', type=int, default=128) # width of PINN
@@ -22,20 +25,67 @@ parser.add_argument('--N_test', type=int, default=int(20000)) # num of test poin
 parser.add_argument('--x_radius', type=float, default=1)
 parser.add_argument('--method', type=int, default=3)
 parser.add_argument('--batch_size', type=int, default=5)
+parser.add_argument('--hessian_engine', type=str, default='loop', choices=LAPLACIAN_ENGINES) # how d2u/dxi2 is computed
+parser.add_argument('--engine_check_dims', type=int, default=8) # random dimensions of the startup check of --hessian_engine against the loop engine (0: skip)
+parser.add_argument('--resample_backend', type=str, default='numpy', choices=['numpy', 'torch']) # where collocation points and forcing are generated
+parser.add_argument('--prefetch_workers', type=int, default=0) # background collocation workers (0: resample synchronously)
+parser.add_argument('--prefetch_depth', type=int, default=4) # max number of batches kept ready
+parser.add_argument('--eval_every', type=int, default=1) # epochs between two full test evaluations
+parser.add_argument('--eval_chunk', type=int, default=4096) # test points per evaluation chunk
+parser.add_argument('--eval_subsample', type=int, default=0) # test points of the rolling estimate between full evaluations (0: off)
+parser.add_argument('--test_mmap', type=int, default=0) # keep the test set in a memory map and stream it?
+parser.add_argument('--test_cache', type=str, default='') # directory of the test sets shared across runs, streamed from disk (empty: regenerate)
+parser.add_argument('--adaptive_dims', type=int, default=0) # method 3: draw dimensions in proportion to a running RMS of d2u/dxi2, reweighted to stay unbiased
+parser.add_argument('--dims_floor', type=float, default=0.1) # share of the uniform distribution in the adaptive dimension probabilities
+parser.add_argument('--dims_momentum', type=float, default=0.9) # decay of the running RMS of the adaptive dimension sampler
+parser.add_argument('--n_probes', type=int, default=5) # Hutchinson probes per point (method 5)
+parser.add_argument('--probe_dist', type=str, default='rademacher', choices=PROBE_DISTRIBUTIONS)
+parser.add_argument('--unbiased_loss', type=int, default=0) # use a second probe set for an unbiased squared residual?
+parser.add_argument('--precision', type=str, default='float32', choices=PRECISIONS) # bf16 autocast with float32 accumulation, or a float64 reference
+parser.add_argument('--profile', type=int, default=0) # time every phase of the training step and report the peak memory?
+parser.add_argument('--profile_trace_start', type=int, default=10) # first epoch of the torch.profiler trace
+parser.add_argument('--profile_trace_steps', type=int, default=0) # epochs in the torch.profiler trace (0: no trace)
+parser.add_argument('--ckpt_every', type=int, default=0) # epochs between two checkpoints (0: off)
+parser.add_argument('--ckpt_path', type=str, default='') # checkpoint file, checkpoints/<run name>.pt if empty
+parser.add_argument('--resume', type=int, default=0) # continue from the checkpoint if there is one?
+parser.add_argument('--compile', type=int, default=0) # run the residual, backward and Adam update as one torch.compile'd step (methods 0 and 3)
+parser.add_argument('--compile_backend', type=str, default='inductor')
+parser.add_argument('--dp_split', type=str, default='points', choices=['points', 'dims', 'laplacian']) # what torchrun workers split: the N_f points, the sampled dimensions (method 3) or the terms of one residual (methods 0 and 3)
+parser.add_argument('--dp_baseline_ms', type=float, default=0) # single-process ms/step of the same run, to report the scaling efficiency
 args = parser.parse_args()
+if args.compile and (args.method not in [0, 3] or args.hessian_engine == "loop"):
+    parser.error("--compile supports methods 0 and 3 with a torch.func hessian engine (jvp_vjp, jvp_jvp, forward_laplacian)")
+if args.adaptive_dims and (args.method != 3 or args.hessian_engine not in HESSIAN_ENGINES or args.compile):
+    parser.error("--adaptive_dims needs method 3 without --compile and a hessian engine that returns every d2u/dxi2 (%s)" % ", ".join(HESSIAN_ENGINES))
+rank, world_size = init_distributed("gloo") # launched by torchrun --nproc_per_node N, a single process otherwise
+if world_size > 1 and args.compile:
+    parser.error("--compile runs the optimizer step inside the graph, it cannot be combined with gradient all-reduce")
+if world_size > 1 and args.adaptive_dims:
+    parser.error("--adaptive_dims keeps a per-process estimate, it cannot be combined with torchrun")
+if world_size > 1 and args.dp_split == "dims" and (args.method != 3 or args.batch_size < world_size):
+    parser.error("--dp_split dims needs method 3 and at least one sampled dimension per worker")
+if world_size > 1 and args.dp_split == "laplacian" and (args.method not in [0, 3] or (args.batch_size if args.method == 3 else args.dim) < world_size):
+    parser.error("--dp_split laplacian needs method 0 or 3 and at least one sampled dimension per worker")
 print(args)
 
 device = torch.device(args.device)
+policy = PrecisionPolicy(args.precision, device)
+print("Precision:", policy)
 torch.manual_seed(args.SEED)
 torch.cuda.manual_seed(args.SEED)
 np.random.seed(args.SEED)
 assert args.dataset == "Poisson"
+# c, the test set and the dimension draws use the shared NumPy stream on every rank. Sharded
+# collocation points come from a private stream per rank, shared ones from the run seed
+shard_points = world_size > 1 and args.dp_split == "points"
+N_f = len(range(args.N_f)[shard(args.N_f, rank, world_size)]) if shard_points else args.N_f
+sample_seed = rank_seed(args.SEED, rank) if shard_points else args.SEED
 
 c = np.random.randn(1, args.dim - 1)
 const_2 = 1
-def load_data_TwoBody_Poisson(d):
-    args.input_dim = d
-    args.output_dim = 1
+args.input_dim = args.dim
+args.output_dim = 1
+def load_data_TwoBody_Poisson(d, directory=None, chunk_size=65536):
     def func_u(x):
         temp =  args.x_radius**2 - np.sum(x**2, 1)
         temp2 = c * np.sin(x[:, :-1] + const_2 * np.cos(x[:, 1:]) + x[:, 1:] * np.cos(x[:, :-1]))
@@ -44,49 +94,87 @@ def load_data_TwoBody_Poisson(d):
 
     N_test = args.N_test
 
-    x = np.random.randn(N_test, d)
-    r = np.random.rand(N_test, 1) * args.x_radius
-    x = x / np.linalg.norm(x, axis=1, keepdims=True) * r
-    u = func_u(x)
-    return x, u
+    if directory is None:
+        x = np.random.randn(N_test, d)
+        r = np.random.rand(N_test, 1) * args.x_radius
+        x = x / np.linalg.norm(x, axis=1, keepdims=True) * r
+        u = func_u(x)
+        return x, u
 
-x, u = load_data_TwoBody_Poisson(d=args.dim)
+    # the same draws, written chunk by chunk to x.npy and u.npy in directory so that
+    # the test set never sits in memory
+    x = np.lib.format.open_memmap(os.path.join(directory, "x.npy"), mode="w+", shape=(N_test, d))
+    u = np.lib.format.open_memmap(os.path.join(directory, "u.npy"), mode="w+", shape=(N_test,))
+    for start in range(0, N_test, chunk_size):
+        x[start:start + chunk_size] = np.random.randn(min(chunk_size, N_test - start), d)
+    for start in range(0, N_test, chunk_size):
+        r = np.random.rand(min(chunk_size, N_test - start), 1) * args.x_radius
+        chunk = x[start:start + chunk_size]
+        chunk = chunk / np.linalg.norm(chunk, axis=1, keepdims=True) * r
+        x[start:start + chunk_size] = chunk
+        u[start:start + chunk_size] = func_u(chunk)
+    x.flush()
+    u.flush()
+    return np.load(os.path.join(directory, "x.npy"), mmap_mode="r"), np.load(os.path.join(directory, "u.npy"), mmap_mode="r")
+
+if args.test_cache: # a hit loads the memory maps written by an earlier run with the same test set
+    x, u = cached_test_set(
+        lambda directory: load_data_TwoBody_Poisson(args.dim, directory), args.test_cache,
+        dim=args.dim, N_test=args.N_test, SEED=args.SEED, x_radius=args.x_radius, const_2=const_2
+    )
+elif args.test_mmap: # keep the test set on disk, in a directory removed at exit, and stream it during evaluation
+    x, u = load_data_TwoBody_Poisson(args.dim, scratch_dir())
+else:
+    x, u = load_data_TwoBody_Poisson(d=args.dim)
 print(x.shape, u.shape)
 print(u.mean(), u.std())
 
-class MLP(nn.Module):
-    def __init__(self, layers:list):
-        super(MLP, self).__init__()
-        models = []
-        for i in range(len(layers)-1):
-            models.append(nn.Linear(layers[i], layers[i+1]))
-            if i != len(layers)-2:
-                models.append(nn.Tanh())
-        self.nn = nn.Sequential(*models)
-    def forward(self, x):
-        return ((1 - torch.sum(x**2, 1, keepdims=True)) * self.nn(x))
-
 class PINN:
     def __init__(self):
         self.epoch = args.epochs
         self.adam_lr = args.lr
         self.dim, self.batch_size = args.dim, args.batch_size
-        self.x = torch.tensor(x, dtype=torch.float32, requires_grad=False).to(device)
-        self.u = torch.tensor(u, dtype=torch.float32, requires_grad=False).to(device).reshape(-1)
         # Initalize Neural Networks
         layers = [args.input_dim] + [args.PINN_h] * (args.PINN_L - 1) + [args.output_dim]
 
-        self.u_net = MLP(layers).to(device)
+        self.u_net = MLP(layers).to(device, policy.dtype)
+        self.evaluator = Evaluator(self.u_net, x, u, chunk_size=args.eval_chunk, subsample=args.eval_subsample, device=device, dtype=policy.dtype, seed=args.SEED)
 
         self.net_params_pinn = list(self.u_net.parameters())
-        self.saved_loss = []
-        self.saved_l2 = []
+        self.step_times = []
+        self.N_f = N_f
+        self.rng = np.random.RandomState(sample_seed) if shard_points else np.random
+        # each rank only holds the gradient of its own Laplacian terms when they are sharded
+        self.reducer = GradAllReducer(self.net_params_pinn, average=args.dp_split != "laplacian")
+        self.reducer.broadcast() # same initialization on every rank
+        self.dim_sampler = DimensionSampler(self.dim, self.batch_size, args.dims_floor, args.dims_momentum) if args.adaptive_dims else None
+        self.sampler = TwoBodyPoissonSampler(c, N_f, args.x_radius, const_2, device=device, dtype=policy.dtype, seed=sample_seed)
+        if args.prefetch_workers > 0:
+            self.pipeline = self.make_pipeline()
+
+        if args.hessian_engine != "loop" and args.engine_check_dims > 0: # check the batched engine against the autograd loop
+            # a few dimensions on a few points, from a private stream: the full check would cost dim x dim HVPs
+            check_idx = np.random.RandomState(args.SEED).choice(self.dim, min(self.dim, args.engine_check_dims), replace=False)
+            err = check_hessian_engine(self.u_net, torch.tensor(x[:16], dtype=policy.dtype).to(device), check_idx, args.hessian_engine)
+            print("Hessian engine %s, max abs err vs loop: %e" % (args.hessian_engine, err))
+
+    def make_pipeline(self, start=0): # workers sample on the CPU and hand batches over to device
+        return PrefetchSampler(
+            lambda: TwoBodyPoissonSampler(c, N_f, args.x_radius, const_2, device="cpu", dtype=policy.dtype),
+            num_workers=args.prefetch_workers, depth=args.prefetch_depth, seed=sample_seed, device=device, start=start
+        )
 
     def Resample(self): # sample random points at the begining of each iteration
-        N_f = args.N_f # Number of collocation points
+        if args.prefetch_workers > 0:
+            self.xf, self.ff = self.pipeline.next()
+            return
+        if args.resample_backend == "torch":
+            self.xf, self.ff = self.sampler.sample()
+            return
+        N_f = self.N_f # Number of collocation points
 
-        xf = np.random.randn(N_f, args.dim)
-        rf = np.random.rand(N_f, 1) * args.x_radius
+        xf = self.rng.randn(N_f, args.dim)
+        rf = self.rng.rand(N_f, 1) * args.x_radius
         xf = xf / np.linalg.norm(xf, axis=1, keepdims=True) * rf
         x = xf
 
@@ -115,106 +203,270 @@ class PINN:
         ff = u1 * d2u2_dx2 + 2 * du1_dx * du2_dx + u2 * d2u1_dx2
         ff = np.sum(ff, 1)
 
-        self.xf = torch.tensor(xf, dtype=torch.float32, requires_grad=True).to(device)
-        self.ff = torch.tensor(ff, dtype=torch.float32, requires_grad=True).to(device)
+        self.xf = torch.tensor(xf, dtype=policy.dtype, requires_grad=True).to(device)
+        self.ff = torch.tensor(ff, dtype=policy.dtype, requires_grad=True).to(device)
         return
 
+    def sharded_laplacian(self, x, idx): # partial Laplacian over idx, each rank computing its own part of idx with --dp_split laplacian
+        if args.dp_split != "laplacian":
+            return laplacian(self.u_net, x, idx, args.hessian_engine)
+        idx = np.asarray(idx)[shard(len(idx), rank, world_size)]
+        # the same collocation batch on every rank: summing the partial sums gives the full one
+        return all_reduce_sum(laplacian(self.u_net, x, idx, args.hessian_engine))
+
     def Method0(self): # Vanilla PINN
         x = self.xf
-        x.requires_grad_()
-        f = self.u_net(x)
-        u_x = torch.autograd.grad(f.sum(), x, create_graph=True)[0]
-
-        u_xx = []
-        for i in range(self.dim):
-            d2f_dxidxi = torch.autograd.grad(u_x[:, i].sum(), x, create_graph=True)[0][:, i:i+1]
-            u_xx.append(d2f_dxidxi)
-        # (batch_size, x_dim)
-        u_xx = torch.concat(u_xx, dim=1)
-
-        residual_pred = torch.sum(u_xx, dim=1) - self.ff
+        # (batch_size,)
+        with policy.autocast():
+            u_lap = self.sharded_laplacian(x, range(self.dim))
+        u_lap = policy.accumulate(u_lap)
+
+        residual_pred = u_lap - self.ff
         loss = residual_pred.square().mean()
         saeved_loss = loss
         return loss, saeved_loss
     
     def Method3(self): #SDGD Algorithm 3
+        if self.dim_sampler is not None:
+            return self.Method3_adaptive()
         x = self.xf
-        x.requires_grad_()
-        f = self.u_net(x)
-        u_x = torch.autograd.grad(f.sum(), x, create_graph=True)[0]
-
-        residual_pred = 0
         idx = np.random.choice(self.dim, self.batch_size, replace=False)
-        for i in idx:
-            d2f_dxidxi = torch.autograd.grad(u_x[:, i].sum(), x, create_graph=True)[0][:, i]
-            residual_pred += d2f_dxidxi
+        if args.dp_split == "dims": # every rank takes its part of the shared draw
+            idx = idx[shard(self.batch_size, rank, world_size)]
+        # (batch_size,)
+        with policy.autocast():
+            u_lap = self.sharded_laplacian(x, idx)
+        u_lap = policy.accumulate(u_lap)
+
+        residual_pred = u_lap * self.dim / len(idx) - self.ff
+        loss = residual_pred.square().mean()
+        saeved_loss = loss
+        return loss, saeved_loss
 
-        residual_pred = residual_pred * self.dim / self.batch_size - self.ff
+    def Method3_adaptive(self): # SDGD Algorithm 3 with importance-sampled dimensions
+        x = self.xf
+        idx, weights = self.dim_sampler.sample()
+        # (batch_size,), possibly repeated
+        with policy.autocast():
+            u_xx = hessian_diag(self.u_net, x, idx, args.hessian_engine)
+        u_xx = policy.accumulate(u_xx)
+        self.dim_sampler.update(idx, u_xx)
+
+        u_lap = u_xx @ torch.as_tensor(weights, dtype=u_xx.dtype, device=u_xx.device)
+        residual_pred = u_lap - self.ff
         loss = residual_pred.square().mean()
         saeved_loss = loss
         return loss, saeved_loss
 
+    def sdgd_loss(self, net, xf, ff, idx): # Method0/Method3 loss for an index tensor of fixed length, traced by the compiled step
+        with policy.autocast():
+            u_lap = laplacian(net, xf, idx, args.hessian_engine)
+        u_lap = policy.accumulate(u_lap)
+
+        residual_pred = u_lap * self.dim / idx.numel() - ff
+        loss = residual_pred.square().mean()
+        return loss, loss.detach()
+
+    def sample_idx(self): # sampled dimensions as a device tensor, same NumPy stream as Method3
+        if args.method == 0:
+            return torch.arange(self.dim, device=device)
+        idx = np.random.choice(self.dim, self.batch_size, replace=False)
+        return torch.as_tensor(idx, dtype=torch.int64, device=device)
+
+    def Method4(self): # SDGD Algorithm 1: full residual in the forward pass, sampled dimensions in the backward pass
+        x = self.xf
+        idx = np.random.choice(self.dim, self.batch_size, replace=False)
+        # (batch_size,), no graph is built for the full residual
+        with policy.autocast():
+            u_lap_full = laplacian_value(self.u_net, x)
+            u_lap = laplacian(self.u_net, x, idx, args.hessian_engine)
+        residual_pred = policy.accumulate(u_lap_full) - self.ff
+        u_lap = policy.accumulate(u_lap)
+
+        # gradient: 2 * mean(r * dim / batch_size * sum_{i in idx} d(d2u/dxi2)/dtheta)
+        loss = 2 * torch.mean(residual_pred * u_lap) * self.dim / self.batch_size
+        saeved_loss = residual_pred.square().mean()
+        return loss, saeved_loss
+    
+    def Method5(self): # Hutchinson trace estimator
+        x = self.xf
+        n_probes = args.n_probes
+        probes = sample_probes(x, 2 * n_probes if args.unbiased_loss else n_probes, args.probe_dist)
+        # (num_probes, batch_size)
+        with policy.autocast():
+            vhv = hutchinson_laplacian(self.u_net, x, probes)
+        vhv = policy.accumulate(vhv)
+
+        residual_pred = vhv[:n_probes].mean(0) - self.ff
+        if args.unbiased_loss: # E[r1 * r2] = r^2 for independent probe sets
+            residual_pred_2 = vhv[n_probes:].mean(0) - self.ff
+            loss = (residual_pred * residual_pred_2).mean()
+            saeved_loss = (0.5 * (residual_pred + residual_pred_2)).square().mean()
+        else:
+            loss = residual_pred.square().mean()
+            saeved_loss = loss
+        return loss, saeved_loss
+
     def num_params(self):
         num_pinn = 0
         for p in self.net_params_pinn:
             num_pinn += len(p.reshape(-1))
         return num_pinn
 
+    def checkpoint_path(self):
+        return (args.ckpt_path or os.path.join("checkpoints", os.path.splitext(os.path.basename(self.metrics_path()))[0] + ".pt")) + (".rank%d" % rank if world_size > 1 else "")
+
+    def checkpoint_state(self, epoch, elapsed, optimizer, scheduler): # everything a bit-for-bit resume needs
+        return {
+            "epoch": epoch,
+            "elapsed": elapsed,
+            "net": self.u_net.state_dict(),
+            "optimizer": optimizer.state_dict(),
+            "scheduler": scheduler.state_dict(),
+            "rng": rng_state(),
+            "rng_rank": self.rng.get_state() if shard_points else None,
+            "sampler": self.sampler.generator.get_state(),
+            "pipeline": self.pipeline.batch_index if args.prefetch_workers > 0 else 0,
+            "evaluator": self.evaluator.generator.bit_generator.state,
+            "c": c,
+            "dim_sampler": self.dim_sampler.state_dict() if self.dim_sampler is not None else None,
+            "metrics_rows": self.metrics.rows if hasattr(self, "metrics") else 0,
+        }
+
+    def load_checkpoint_state(self, state, optimizer, scheduler):
+        if not np.array_equal(state["c"], c):
+            raise ValueError("%s was written for other problem coefficients, check --SEED and --dim" % self.checkpoint_path())
+        self.u_net.load_state_dict(state["net"])
+        optimizer.load_state_dict(state["optimizer"])
+        scheduler.load_state_dict(state["scheduler"])
+        set_rng_state(state["rng"])
+        if shard_points:
+            self.rng.set_state(state["rng_rank"])
+        self.sampler.generator.set_state(state["sampler"])
+        if args.prefetch_workers > 0: # restart the workers at the next batch of the interrupted run
+            self.pipeline.close()
+            self.pipeline = self.make_pipeline(state["pipeline"])
+        self.evaluator.generator.bit_generator.state = state["evaluator"]
+        if self.dim_sampler is not None and state.get("dim_sampler") is not None:
+            self.dim_sampler.load_state_dict(state["dim_sampler"])
+
+    def profile_path(self, suffix): # next to the metrics file
+        return os.path.splitext(self.metrics_path())[0] + suffix
+
+    def metrics_path(self): # convert to .xlsx offline with python -m sdgd.metrics
+        return "saved_loss_l2/"+args.Name+"_"+args.dataset+"_dim="+str(args.dim)+\
+            "_batch="+str(args.batch_size)+"_N_f="+str(args.N_f)\
+            +"_method="+str(args.method)+"_SEED="+str(args.SEED)+"_Num_params="+str(self.num_params())+".csv"
+
     def train_adam(self):
-        optimizer = torch.optim.Adam(self.net_params_pinn, lr=self.adam_lr)
+        # a tensor lr lets the scheduler update the compiled step without recompiling it
+        optimizer = torch.optim.Adam(self.net_params_pinn, lr=torch.tensor(self.adam_lr) if args.compile else self.adam_lr)
         scheduler = torch.optim.lr_scheduler.ExponentialLR(optimizer, gamma=0.9995)
         lr_lambda = lambda epoch: 1-epoch/args.epochs
         scheduler = torch.optim.lr_scheduler.LambdaLR(optimizer, lr_lambda=lr_lambda)
-        L2, L1 = self.L2_pinn()
-        print('Initialization: l2: %e, l1: %e'%(L2, L1))
-        self.saved_loss.append(0)
-        self.saved_l2.append([L2, L1])
+        checkpointer = Checkpointer(self.checkpoint_path())
+        state = checkpointer.load("cpu") if args.resume else None
+        start_epoch, elapsed = 0, 0
+        if state is not None:
+            self.load_checkpoint_state(state, optimizer, scheduler)
+            start_epoch, elapsed = state["epoch"], state["elapsed"]
+            print('Resuming from epoch %d of %s'%(start_epoch, checkpointer.path))
+        if rank == 0 and state is None:
+            L2, L1 = self.L2_pinn()
+            print('Initialization: l2: %e, l1: %e'%(L2, L1))
+            if args.save_loss: # one row per epoch, appended to disk while training
+                self.metrics = MetricsWriter(self.metrics_path(), METRICS_FIELDS + ["precision"])
+                self.metrics.log(epoch=0, time=0, L2=L2, L1=L1, precision=args.precision)
+        elif rank == 0 and args.save_loss: # drop the rows logged after the checkpoint
+            self.metrics = MetricsWriter(self.metrics_path(), METRICS_FIELDS + ["precision"], keep_rows=state["metrics_rows"])
+        start_time = time.perf_counter() - elapsed
+        if args.compile:
+            step = CompiledStep(self.u_net, optimizer, self.sdgd_loss, backend=args.compile_backend)
     
-        for n in tqdm(range(self.epoch)):
-            self.Resample()
-            if args.method == 0:
-                loss, saved_loss = self.Method0()
-            elif args.method == 3:
-                loss, saved_loss = self.Method3()
-            optimizer.zero_grad()
-            loss.backward()
-            optimizer.step()
+        profiler = PhaseProfiler(device, self.profile_path("_trace.json"), args.profile_trace_start, args.profile_trace_steps)
+        if args.profile:
+            profiler.start()
+        for n in tqdm(range(start_epoch, self.epoch), disable=rank != 0):
+            profiler.step(n)
+            start = time.perf_counter()
+            with phase("resample"):
+                self.Resample()
+            if args.compile: # residual, backward and Adam update in one graph
+                with phase("compiled_step"):
+                    saved_loss = step(self.xf.detach(), self.ff.detach(), self.sample_idx())
+            else:
+                if args.method == 0:
+                    loss, saved_loss = self.Method0()
+                elif args.method == 3:
+                    loss, saved_loss = self.Method3()
+                elif args.method == 4:
+                    loss, saved_loss = self.Method4()
+                elif args.method == 5:
+                    loss, saved_loss = self.Method5()
+                optimizer.zero_grad()
+                with phase("backward"):
+                    loss.backward()
+                    self.reducer() # average the gradients of all ranks, or sum their Laplacian shards
+                with phase("optimizer"):
+                    optimizer.step()
             if args.use_sch:
                 scheduler.step()
             current_loss = saved_loss.item()
-            if n % 100 == 0:
+            step_time = time.perf_counter() - start
+            self.step_times.append(step_time)
+            # rank 0 evaluates and records the run
+            # the console report every 100 epochs is a full evaluation too, so its row records it
+            evaluate = rank == 0 and (n % 100 == 0 or (args.save_loss and ((n + 1) % args.eval_every == 0 or n == self.epoch - 1)))
+            if evaluate:
                 L2, L1 = self.L2_pinn()
-                print('epoch %d, loss: %e, l2: %e, l1: %e'%(n, current_loss, L2, L1))
-            if args.save_loss:
-                self.saved_loss.append(current_loss)
-                if n % 100 != 0:
-                    L2, L1 = self.L2_pinn()
-                self.saved_l2.append([L2, L1])
+            if rank == 0 and n % 100 == 0:
+                print('epoch %d (%s), loss: %e, l2: %e, l1: %e'%(n, policy.name, current_loss, L2, L1))
+            if args.save_loss and rank == 0:
+                row = dict(epoch=n + 1, time=time.perf_counter() - start_time, step_time=step_time, loss=current_loss, precision=args.precision)
+                if evaluate:
+                    row.update(L2=L2, L1=L1)
+                elif args.eval_subsample > 0: # cheap estimate between full evaluations
+                    with phase("evaluation"), policy.autocast():
+                        row["L2_est"], row["L1_est"] = self.evaluator.rolling()
+                self.metrics.log(**row)
+            if args.ckpt_every and (n + 1) % args.ckpt_every == 0:
+                self.checkpoint(checkpointer, n + 1, time.perf_counter() - start_time, optimizer, scheduler)
+        if args.save_loss and rank == 0:
+            self.metrics.close()
+            print("Metrics written to", self.metrics.path)
+        checkpointer.wait()
+        profiler.stop()
+        if args.profile and rank == 0:
+            profiler.report(self.profile_path("_profile.csv"))
+        if args.compile:
+            timing = step.summary()
+            print('Compiled step: first step %.2f s, compile %.2f s, steady state %.3f ms/step'%(timing["first_step"], timing["compile"], timing["steady"]))
+        self.report_scaling()
+
+    def report_scaling(self, warmup=10): # steady-state step time, and the strong-scaling efficiency against --dp_baseline_ms
+        step_ms = 1e3 * np.median(self.step_times[warmup:] if len(self.step_times) > warmup else self.step_times)
+        if rank != 0:
+            return
+        print('Steady state: %.3f ms/step on %d process(es)'%(step_ms, world_size))
+        if args.dp_baseline_ms > 0:
+            speedup = args.dp_baseline_ms / step_ms
+            print('Speedup vs single process: %.2f, scaling efficiency: %.1f%%'%(speedup, 100 * speedup / world_size))
+
+    def checkpoint(self, checkpointer, epoch, elapsed, optimizer, scheduler): # snapshot to CPU, written in the background
+        if hasattr(self, "metrics"): # the rows up to the cursor must be on disk
+            self.metrics.flush()
+        checkpointer.save(self.checkpoint_state(epoch, elapsed, optimizer, scheduler))
 
     def predict_pinn(self):
-        f = self.u_net(self.x).reshape(-1)
+        with policy.autocast():
+            f = self.evaluator.predict()
         return f
     
     def L2_pinn(self):
-        pred_u = self.predict_pinn()
-        pred_u = self.u - pred_u
-        L2, L1 = torch.norm(pred_u) / torch.norm(self.u), \
-            torch.norm(pred_u, p=1) / torch.norm(self.u, 1)
-        L2, L1 = L2.item(), L1.item()
+        with phase("evaluation"), policy.autocast():
+            L2, L1 = self.evaluator.full()
         return L2, L1
 
 model = PINN()
 print("Num params:", model.num_params())
 model.train_adam()
-
-if args.save_loss:
-    model.saved_loss = np.asarray(model.saved_loss)
-    model.saved_l2 = np.asarray(model.saved_l2)
-    info_dict = {"loss": model.saved_loss, "L2": model.saved_l2[:, 0], "L1": model.saved_l2[:, 1]}
-    df = pd.DataFrame(data=info_dict, index=None)
-    df.to_excel(
-        "saved_loss_l2/"+args.Name+"_"+args.dataset+"_dim="+str(args.dim)+\
-            "_batch="+str(args.batch_size)+"_N_f="+str(args.N_f)\
-            +"_method="+str(args.method)+"_SEED="+str(args.SEED)+"_Num_params="+str(model.num_params())+".xlsx",
-        index=False
-    )
@@ -17,6 +17,7 @@ class KANLinear(torch.nn.Module):
         base_activation=torch.nn.SiLU,
         grid_eps=0.02,
         grid_range=[-1, 1],
+        fused=False,
     ):
         super(KANLinear, self).__init__()
         self.in_features = in_features
@@ -26,14 +27,11 @@ class KANLinear(torch.nn.Module):
 
         h = (grid_range[1] - grid_range[0]) / grid_size
         grid = (
-            (
-                torch.arange(-spline_order, grid_size + spline_order + 1) * h
-                + grid_range[0]
-            )
-            .expand(in_features, -1)
-            .contiguous()
-        )
+            torch.arange(-spline_order, grid_size + spline_order + 1) * h
+            + grid_range[0]
+        ).unsqueeze(0)  # (1, grid_size + 2 * spline_order + 1), shared by every feature
         self.register_buffer("grid", grid)
+        self.set_grid(grid)
 
         self.base_weight = torch.nn.Parameter(torch.Tensor(out_features, in_features))
         self.spline_weight = torch.nn.Parameter(
@@ -50,6 +48,9 @@ class KANLinear(torch.nn.Module):
         self.enable_standalone_scale_spline = enable_standalone_scale_spline
         self.base_activation = base_activation()
         self.grid_eps = grid_eps
+        # fused: one GEMM over [base_activation(x), bases] without shape checks
+        self.fused = fused
+        self._weight_cache = None
 
         self.reset_parameters()
 
@@ -67,7 +68,7 @@ class KANLinear(torch.nn.Module):
             self.spline_weight.data.copy_(
                 (self.scale_spline if not self.enable_standalone_scale_spline else 1.0)
                 * self.curve2coeff(
-                    self.grid.T[self.spline_order : -self.spline_order],
+                    self.grid.expand(self.in_features, -1).T[self.spline_order : -self.spline_order],
                     noise,
                 )
             )
@@ -87,21 +88,7 @@ class KANLinear(torch.nn.Module):
         """
         assert x.dim() == 2 and x.size(1) == self.in_features
 
-        grid: torch.Tensor = (
-            self.grid
-        )  # (in_features, grid_size + 2 * spline_order + 1)
-        x = x.unsqueeze(-1)
-        bases = ((x >= grid[:, :-1]) & (x < grid[:, 1:])).to(x.dtype)
-        for k in range(1, self.spline_order + 1):
-            bases = (
-                (x - grid[:, : -(k + 1)])
-                / (grid[:, k:-1] - grid[:, : -(k + 1)])
-                * bases[:, :, :-1]
-            ) + (
-                (grid[:, k + 1 :] - x)
-                / (grid[:, k + 1 :] - grid[:, 1:(-k)])
-                * bases[:, :, 1:]
-            )
+        bases = self._dense_b_splines(x)
 
         assert bases.size() == (
             x.size(0),
@@ -110,13 +97,219 @@ class KANLinear(torch.nn.Module):
         )
         return bases.contiguous()
 
-    def curve2coeff(self, x: torch.Tensor, y: torch.Tensor):
+    def _dense_b_splines(self, x: torch.Tensor):
+        grid: torch.Tensor = (
+            self.grid
+        )  # (in_features or 1, grid_size + 2 * spline_order + 1)
+        # the knot spans are small differences of nearby knots: the recursion always runs
+        # in the dtype of the grid, even for a low-precision input under autocast
+        x = x.to(grid.dtype).unsqueeze(-1)
+        with torch.autocast(x.device.type, enabled=False):
+            bases = ((x >= grid[:, :-1]) & (x < grid[:, 1:])).to(x.dtype)
+            for k in range(1, self.spline_order + 1):
+                bases = self._raise_order(x, grid, self.knot_span_inv(k), bases, k)
+        return bases
+
+    @staticmethod
+    def _raise_order(x, grid, inv, bases, k):
+        # Cox-de Boor step from the bases of order k - 1 to the bases of order k,
+        # inv[:, m] = 1 / (t_m+k - t_m) being the reciprocal knot span of order k
+        return (
+            (x - grid[:, : -(k + 1)])
+            * inv[:, :-1]
+            * bases[:, :, :-1]
+        ) + (
+            (grid[:, k + 1 :] - x)
+            * inv[:, 1:]
+            * bases[:, :, 1:]
+        )
+
+    @staticmethod
+    def _differentiate(inv, bases, k):
+        # d/dx of the bases of order k from the bases (or derivatives) of order k - 1:
+        # B'_m,k = k * (B_m,k-1 / (t_m+k - t_m) - B_m+1,k-1 / (t_m+k+1 - t_m+1))
+        return k * (bases[:, :, :-1] * inv[:, :-1] - bases[:, :, 1:] * inv[:, 1:])
+
+    def knot_span_inv(self, k, features=None):
+        """
+        Reciprocal knot spans 1 / (t_m+k - t_m) of order k, of shape
+        (in_features or 1, grid_size + 2 * spline_order + 1 - k), restricted to
+        features unless the grid is shared.
+        """
+        inv = getattr(self, "knot_span_inv_%d" % k)
+        return inv if features is None or inv.size(0) == 1 else inv[features]
+
+    def set_grid(self, grid: torch.Tensor):
+        """
+        Replace the knots and refresh the reciprocal knot spans of every order.
+        Identical rows are stored once as a (1, num_knots) grid broadcast over the
+        features.
+
+        Args:
+            grid (torch.Tensor): Knots of shape (in_features, grid_size + 2 * spline_order + 1),
+                or (1, grid_size + 2 * spline_order + 1) for a grid shared by every feature.
+        """
+        if grid.size(0) > 1 and torch.equal(grid, grid[:1].expand_as(grid)):
+            grid = grid[:1]
+        self.grid = grid.contiguous()
+        # the spans of order 1 also give the interval index of local_b_splines
+        for k in range(1, max(self.spline_order, 1) + 1):
+            self.register_buffer(
+                "knot_span_inv_%d" % k, 1 / (self.grid[:, k:] - self.grid[:, :-k]), persistent=False
+            )
+        # uniform knots allow the closed-form local bases in forward
+        self.uniform_grid = self.grid_is_uniform()
+
+    def b_splines_derivatives(self, x: torch.Tensor, features=None):
+        """
+        Compute the B-spline bases and their first and second derivatives.
+
+        The derivatives are the closed-form combinations of the bases of order
+        spline_order - 1 and spline_order - 2 on the same grid, so no autograd graph
+        through the recursion is needed.
+
+        Args:
+            x (torch.Tensor): Input tensor of shape (batch_size, len(features)).
+            features: Input features of the columns of x, all features if None.
+
+        Returns:
+            tuple: Bases, first and second derivatives, each of shape
+                (batch_size, len(features), grid_size + spline_order).
+        """
+        grid = self.grid if features is None or self.grid.size(0) == 1 else self.grid[features]
+        assert x.dim() == 2
+        k = self.spline_order
+
+        x = x.to(grid.dtype).unsqueeze(-1)
+        with torch.autocast(x.device.type, enabled=False):
+            bases = [((x >= grid[:, :-1]) & (x < grid[:, 1:])).to(x.dtype)]
+            inv = [None] + [self.knot_span_inv(r, features) for r in range(1, k + 1)]
+            for r in range(1, k + 1):
+                bases.append(self._raise_order(x, grid, inv[r], bases[-1], r))
+            d1 = self._differentiate(inv[k], bases[k - 1], k) if k >= 1 else torch.zeros_like(bases[k])
+            d2 = (
+                self._differentiate(inv[k], self._differentiate(inv[k - 1], bases[k - 2], k - 1), k)
+                if k >= 2
+                else torch.zeros_like(bases[k])
+            )
+        return bases[k], d1, d2
+
+    def activation_derivatives(self, x: torch.Tensor):
+        """
+        First and second derivatives of the base activation.
+
+        Args:
+            x (torch.Tensor): Input tensor of any shape.
+
+        Returns:
+            tuple: First and second derivatives, each of the shape of x.
+        """
+        if isinstance(self.base_activation, torch.nn.SiLU):
+            s = torch.sigmoid(x)
+            return s * (1 + x * (1 - s)), s * (1 - s) * (2 + x * (1 - 2 * s))
+        if isinstance(self.base_activation, torch.nn.Tanh):
+            t = torch.tanh(x)
+            return 1 - t**2, -2 * t * (1 - t**2)
+        raise NotImplementedError(
+            "no closed-form derivatives for %s" % type(self.base_activation).__name__
+        )
+
+    def local_b_splines(self, x: torch.Tensor):
+        """
+        Compute the spline_order + 1 nonzero B-spline bases of each input.
+
+        Only the bases j - spline_order, ..., j of the knot interval j of x are nonzero.
+        They are evaluated by the local Cox-de Boor recursion instead of the recursion
+        over every knot of b_splines. On uniform knots t_0 + m * h the interval is
+        j = floor((x - t_0) / h) and the denominators are all equal to the order; on
+        other grids, such as those of update_grid, j comes from a binary search of the
+        knots and the denominators are the knot spans. Inputs outside the grid and
+        bases beyond the ends of the grid get a zero value.
+
+        Args:
+            x (torch.Tensor): Input tensor of shape (batch_size, in_features).
+
+        Returns:
+            tuple: Basis indices, an int64 tensor of shape (batch_size, in_features, spline_order + 1)
+                clamped to the valid range, and bases tensor of the same shape.
+        """
+        grid = self.grid
+        k = self.spline_order
+        num_bases = self.grid_size + k
+        x = x.to(grid.dtype)
+        with torch.autocast(x.device.type, enabled=False):
+            if not self.uniform_grid:
+                return self._local_b_splines_nonuniform(x)
+            u = (x - grid[:, 0]) * self.knot_span_inv(1)[:, 0]
+            j = torch.floor(u)
+            t = u - j
+            j = j.to(torch.int64)
+            inside = (j >= 0) & (j < grid.size(1) - 1)
+            bases = [torch.ones_like(t)]
+            for r in range(1, k + 1):
+                saved = torch.zeros_like(t)
+                for s in range(r):
+                    # left = t + r - s - 1 and right = s + 1 - t sum to r on uniform knots
+                    temp = bases[s] * (1.0 / r)
+                    bases[s] = saved + (s + 1 - t) * temp
+                    saved = (t + r - s - 1) * temp
+                bases.append(saved)
+            bases = torch.stack(bases, dim=-1)
+            index = j.unsqueeze(-1) - k + torch.arange(k + 1, device=x.device)
+            valid = inside.unsqueeze(-1) & (index >= 0) & (index < num_bases)
+            bases = bases * valid.to(bases.dtype)
+        return index.clamp(0, num_bases - 1), bases
+
+    def _local_b_splines_nonuniform(self, x):
+        # local_b_splines on arbitrary knots, x being in the dtype of the grid
+        grid = self.grid
+        k = self.spline_order
+        num_bases = self.grid_size + k
+        num_knots = grid.size(1)
+        # interval j with t_j <= x < t_j+1, the convention of the dense recursion
+        if grid.size(0) == 1:
+            j = torch.searchsorted(grid[0], x.contiguous(), right=True) - 1
+        else:
+            j = (torch.searchsorted(grid, x.T.contiguous(), right=True) - 1).T
+        inside = (j >= 0) & (j < num_knots - 1)
+        flat = grid.reshape(-1)
+        offset = torch.arange(grid.size(0), device=x.device) * num_knots
+
+        def knot(m):
+            # t_j+m, clamped at the ends of the grid where the bases are masked anyway
+            return flat[(j + m).clamp(0, num_knots - 1) + offset]
+
+        left = [None] + [x - knot(1 - r) for r in range(1, k + 1)]
+        right = [None] + [knot(r) - x for r in range(1, k + 1)]
+        bases = [torch.ones_like(x)]
+        for r in range(1, k + 1):
+            saved = torch.zeros_like(x)
+            for s in range(r):
+                # right + left = t_j+s+1 - t_j+s+1-r, the knot span of order r
+                temp = bases[s] / (right[s + 1] + left[r - s])
+                bases[s] = saved + right[s + 1] * temp
+                saved = left[r - s] * temp
+            bases.append(saved)
+        bases = torch.stack(bases, dim=-1)
+        index = j.unsqueeze(-1) - k + torch.arange(k + 1, device=x.device)
+        valid = inside.unsqueeze(-1) & (index >= 0) & (index < num_bases)
+        # the clamped knots may give zero spans, hence a select rather than a product
+        bases = torch.where(valid, bases, torch.zeros_like(bases))
+        return index.clamp(0, num_bases - 1), bases
+
+    def curve2coeff(self, x: torch.Tensor, y: torch.Tensor, ridge=None):
         """
         Compute the coefficients of the curve that interpolates the given points.
 
+        Without ridge this is the exact least-squares solution of torch.linalg.lstsq.
+        With a ridge the normal equations (A^T A + ridge * mean(diag(A^T A)) * I) c = A^T y
+        are solved by a batched Cholesky factorization, which is much cheaper than
+        lstsq and well posed even where few points fall in a knot span.
+
         Args:
             x (torch.Tensor): Input tensor of shape (batch_size, in_features).
             y (torch.Tensor): Output tensor of shape (batch_size, in_features, out_features).
+            ridge (float): Relative ridge of the normal equations, None for lstsq.
 
         Returns:
             torch.Tensor: Coefficients tensor of shape (out_features, in_features, grid_size + spline_order).
@@ -124,13 +317,17 @@ class KANLinear(torch.nn.Module):
         assert x.dim() == 2 and x.size(1) == self.in_features
         assert y.size() == (x.size(0), self.in_features, self.out_features)
 
-        A = self.b_splines(x).transpose(
-            0, 1
-        )  # (in_features, batch_size, grid_size + spline_order)
-        B = y.transpose(0, 1)  # (in_features, batch_size, out_features)
-        solution = torch.linalg.lstsq(
-            A, B
-        ).solution  # (in_features, grid_size + spline_order, out_features)
+        solution = None
+        if ridge is not None:
+            solution = self._ridge_solve(x, y, ridge)
+        if solution is None:
+            A = self.b_splines(x).transpose(
+                0, 1
+            )  # (in_features, batch_size, grid_size + spline_order)
+            B = y.transpose(0, 1).to(A.dtype)  # (in_features, batch_size, out_features)
+            solution = torch.linalg.lstsq(
+                A, B
+            ).solution  # (in_features, grid_size + spline_order, out_features)
         result = solution.permute(
             2, 0, 1
         )  # (out_features, in_features, grid_size + spline_order)
@@ -142,6 +339,62 @@ class KANLinear(torch.nn.Module):
         )
         return result.contiguous()
 
+    def gram(self, x: torch.Tensor, local=None):
+        """
+        Gram matrix A^T A of the B-spline bases at x for every input feature. It is
+        banded with bandwidth spline_order and assembled from the (spline_order + 1)^2
+        products of the nonzero bases of each point only.
+
+        Args:
+            x (torch.Tensor): Input tensor of shape (batch_size, in_features).
+            local (tuple): local_b_splines(x), computed if None.
+
+        Returns:
+            torch.Tensor: Gram tensor of shape (in_features, grid_size + spline_order, grid_size + spline_order).
+        """
+        num_bases = self.grid_size + self.spline_order
+        index, bases = self.local_b_splines(x) if local is None else local  # (batch, in, spline_order + 1)
+        products = (bases.unsqueeze(-1) * bases.unsqueeze(-2)).transpose(0, 1)
+        cells = (index.unsqueeze(-1) * num_bases + index.unsqueeze(-2)).transpose(0, 1)
+        gram = bases.new_zeros(self.in_features, num_bases * num_bases).scatter_add_(
+            1, cells.reshape(self.in_features, -1), products.reshape(self.in_features, -1)
+        )
+        return gram.view(self.in_features, num_bases, num_bases)
+
+    def project(self, x: torch.Tensor, y: torch.Tensor, local=None):
+        """
+        Right-hand side A^T y of the normal equations for every input feature,
+        accumulated from the nonzero bases of each point only.
+
+        Args:
+            x (torch.Tensor): Input tensor of shape (batch_size, in_features).
+            y (torch.Tensor): Output tensor of shape (batch_size, in_features, out_features).
+            local (tuple): local_b_splines(x), computed if None.
+
+        Returns:
+            torch.Tensor: Tensor of shape (in_features, grid_size + spline_order, out_features).
+        """
+        num_bases = self.grid_size + self.spline_order
+        index, bases = self.local_b_splines(x) if local is None else local
+        index, bases = index.transpose(0, 1), bases.transpose(0, 1)  # (in, batch, spline_order + 1)
+        y = y.transpose(0, 1).to(bases.dtype)  # (in, batch, out)
+        rhs = y.new_zeros(self.in_features, num_bases, self.out_features)
+        for s in range(self.spline_order + 1):
+            rhs.scatter_add_(1, index[..., s, None].expand_as(y), bases[..., s, None] * y)
+        return rhs
+
+    def _ridge_solve(self, x, y, ridge):
+        # (in, coeff, out) solution of the ridge normal equations, None if a factorization failed
+        local = self.local_b_splines(x)
+        gram = self.gram(x, local)
+        diag = gram.diagonal(dim1=-2, dim2=-1)
+        shift = ridge * diag.mean(-1).clamp_min(torch.finfo(gram.dtype).tiny)
+        gram = gram + shift[:, None, None] * torch.eye(gram.size(-1), dtype=gram.dtype, device=gram.device)
+        factor, info = torch.linalg.cholesky_ex(gram)
+        if info.any():
+            return None
+        return torch.cholesky_solve(self.project(x, y, local), factor)
+
     @property
     def scaled_spline_weight(self):
         return self.spline_weight * (
@@ -151,24 +404,188 @@ class KANLinear(torch.nn.Module):
         )
 
     def forward(self, x: torch.Tensor):
+        if self.fused:
+            return self.fused_forward(x)
         assert x.size(-1) == self.in_features
         original_shape = x.shape
         x = x.reshape(-1, self.in_features)
 
         base_output = F.linear(self.base_activation(x), self.base_weight)
-        spline_output = F.linear(
-            self.b_splines(x).view(x.size(0), -1),
-            self.scaled_spline_weight.view(self.out_features, -1),
-        )
+        if self.uniform_grid:
+            spline_output = self.local_spline_output(x)
+        else:
+            spline_output = F.linear(
+                self.b_splines(x).view(x.size(0), -1),
+                self.scaled_spline_weight.view(self.out_features, -1),
+            )
         output = base_output + spline_output
         
         output = output.reshape(*original_shape[:-1], self.out_features)
         return output
 
+    def combined_weight(self):
+        """
+        Weight of the fused forward, base_weight followed by the flattened
+        scaled_spline_weight, of shape (out_features, in_features * (1 + grid_size + spline_order)).
+
+        Outside of autograd (evaluation, the full residual of Method4) the weight is
+        cached and only rebuilt when a parameter was modified, moved or reloaded.
+        Under autograd it is rebuilt on every call so that each graph owns its copy.
+        """
+        if torch.is_grad_enabled():
+            return self._combine_weights()
+        key = tuple((p.data_ptr(), p._version) for p in self.parameters(recurse=False))
+        if self._weight_cache is None or self._weight_cache[0] != key:
+            self._weight_cache = (key, self._combine_weights())
+        return self._weight_cache[1]
+
+    def _combine_weights(self):
+        return torch.cat(
+            [self.base_weight, self.scaled_spline_weight.view(self.out_features, -1)],
+            dim=1,
+        )
+
+    def fused_forward(self, x: torch.Tensor):
+        """
+        Forward pass as a single GEMM of the feature buffer [base_activation(x), bases]
+        with combined_weight(), skipping the shape checks of forward. The bases come
+        from local_b_splines on a uniform grid and from the dense recursion otherwise.
+
+        Args:
+            x (torch.Tensor): Input tensor of shape (..., in_features).
+
+        Returns:
+            torch.Tensor: Output tensor of shape (..., out_features).
+        """
+        original_shape = x.shape
+        x = x.reshape(-1, self.in_features)
+        batch = x.size(0)
+        if self.uniform_grid:
+            index, bases = self.local_b_splines(x)
+            bases = bases.to(x.dtype)
+            bases = bases.new_zeros(
+                batch, self.in_features, self.grid_size + self.spline_order
+            ).scatter_add(-1, index, bases)
+        else:
+            bases = self._dense_b_splines(x).to(x.dtype)
+        features = torch.cat([self.base_activation(x), bases.view(batch, -1)], dim=1)
+        output = F.linear(features, self.combined_weight())
+        return output.reshape(*original_shape[:-1], self.out_features)
+
+    def local_spline_output(self, x: torch.Tensor):
+        """
+        Spline branch of forward from the local bases of a uniform grid.
+
+        Narrow layers gather the spline_order + 1 coefficients of every input and
+        contract them with the bases, which moves (spline_order + 1) * out_features
+        values per input and feature. When that exceeds the grid_size + spline_order
+        values of a dense basis row, the local bases are scattered into a dense basis
+        and multiplied by one GEMM instead, which still skips the full recursion.
+
+        Args:
+            x (torch.Tensor): Input tensor of shape (batch_size, in_features).
+
+        Returns:
+            torch.Tensor: Spline output of shape (batch_size, out_features).
+        """
+        index, bases = self.local_b_splines(x)
+        bases = bases.to(x.dtype)
+        num_bases = self.grid_size + self.spline_order
+        weight = self.scaled_spline_weight  # (out, in, coeff)
+        if (self.spline_order + 1) * self.out_features <= num_bases:
+            features = torch.arange(self.in_features, device=x.device).unsqueeze(-1)
+            coeff = weight.permute(1, 2, 0)[features, index]  # (batch, in, spline_order + 1, out)
+            return torch.einsum("bik,biko->bo", bases, coeff)
+        # out of place, so that the vmapped torch.func hessian engines can batch it
+        dense = bases.new_zeros(x.size(0), self.in_features, num_bases).scatter_add(-1, index, bases)
+        return F.linear(dense.view(x.size(0), -1), weight.view(self.out_features, -1))
+
+    def edge_derivatives(self, x: torch.Tensor, features=None):
+        """
+        First and second derivatives of every edge function
+        phi_oi(x_i) = base_weight_oi * silu(x_i) + sum_m scaled_spline_weight_oim * B_m(x_i).
+
+        Args:
+            x (torch.Tensor): Input tensor of shape (batch_size, len(features)).
+            features: Input features of the columns of x, all features if None.
+
+        Returns:
+            tuple: phi'_oi(x_i) and phi''_oi(x_i), each of shape (batch_size, len(features), out_features).
+        """
+        base_weight = self.base_weight.T  # (in, out)
+        spline_weight = self.scaled_spline_weight  # (out, in, coeff)
+        if features is not None:
+            base_weight, spline_weight = base_weight[features], spline_weight[:, features]
+        act_d1, act_d2 = self.activation_derivatives(x)
+        _, bases_d1, bases_d2 = self.b_splines_derivatives(x, features)
+        phi_d1 = act_d1.unsqueeze(-1) * base_weight + torch.einsum(
+            "bim,oim->bio", bases_d1.to(x.dtype), spline_weight
+        )
+        phi_d2 = act_d2.unsqueeze(-1) * base_weight + torch.einsum(
+            "bim,oim->bio", bases_d2.to(x.dtype), spline_weight
+        )
+        return phi_d1, phi_d2
+
+    def forward_laplacian(self, x: torch.Tensor, grad=None, lap=None, idx=None):
+        """
+        Propagate the value, the input gradient over idx and the partial Laplacian
+        over idx through the layer.
+
+        Every output is a sum of univariate edge functions, y_o = sum_i phi_oi(x_i),
+        so grad y_o = sum_i phi'_oi * grad x_i and
+        lap y_o = sum_i phi'_oi * lap x_i + phi''_oi * |grad x_i|^2.
+
+        Args:
+            x (torch.Tensor): Input tensor of shape (batch_size, in_features).
+            grad (torch.Tensor): Gradient of x over idx, of shape (batch_size, len(idx), in_features),
+                None if x is the network input.
+            lap (torch.Tensor): Partial Laplacian of x, of shape (batch_size, in_features),
+                None if x is the network input.
+            idx (torch.Tensor): Sampled dimensions, only used when x is the network input.
+
+        Returns:
+            tuple: Value of shape (batch_size, out_features), gradient of shape
+                (batch_size, len(idx), out_features) and partial Laplacian of shape
+                (batch_size, out_features).
+        """
+        y = self(x)
+        if grad is None:
+            # dx_i/dx_j = delta_ij: only the sampled features carry derivatives
+            phi_d1, phi_d2 = self.edge_derivatives(x[:, idx], idx)
+            return y, phi_d1, phi_d2.sum(1)
+        phi_d1, phi_d2 = self.edge_derivatives(x)
+        grad_y = torch.bmm(grad, phi_d1)
+        lap_y = torch.einsum("bi,bio->bo", lap, phi_d1) + torch.einsum(
+            "bi,bio->bo", grad.square().sum(1), phi_d2
+        )
+        return y, grad_y, lap_y
+
+    def grid_is_uniform(self):
+        spacing = self.grid[:, 1:] - self.grid[:, :-1]
+        return bool(torch.allclose(spacing, spacing[:, :1]))
+
+    def _load_from_state_dict(self, state_dict, prefix, *args, **kwargs):
+        # a per-feature grid (or one saved before grids were shared) replaces a shared one
+        grid = state_dict.get(prefix + "grid")
+        if grid is not None and grid.shape != self.grid.shape:
+            self.grid = torch.empty_like(grid, dtype=self.grid.dtype, device=self.grid.device)
+        super()._load_from_state_dict(state_dict, prefix, *args, **kwargs)
+        self.set_grid(self.grid)
+
     @torch.no_grad()
-    def update_grid(self, x: torch.Tensor, margin=0.01):
+    def update_grid(self, x: torch.Tensor, margin=0.01, ridge=None):
+        """
+        Adapt the grid to the distribution of x and refit the spline coefficients so
+        that the layer keeps its outputs at x. The refit is the exact lstsq of
+        curve2coeff, or its ridge normal equations if a ridge is given.
+
+        Returns:
+            float: Relative L2 change of the layer outputs at x, the projection error
+                of the old splines on the new grid plus the bias of the ridge.
+        """
         assert x.dim() == 2 and x.size(1) == self.in_features
         batch = x.size(0)
+        output = self(x)
 
         splines = self.b_splines(x)  # (batch, in, coeff)
         splines = splines.permute(1, 0, 2)  # (in, batch, coeff)
@@ -211,8 +628,15 @@ class KANLinear(torch.nn.Module):
             dim=0,
         )
 
-        self.grid.copy_(grid.T)
-        self.spline_weight.data.copy_(self.curve2coeff(x, unreduced_spline_output))
+        # an adapted grid is in general not uniform: forward then falls back to the dense bases
+        self.set_grid(grid.T.to(self.grid.dtype))
+        coeff = self.curve2coeff(x, unreduced_spline_output, ridge)
+        if self.enable_standalone_scale_spline: # the target is the scaled weight, forward scales again
+            coeff = coeff / self.spline_scaler.unsqueeze(-1)
+        self.spline_weight.data.copy_(coeff)
+        # writes through .data do not bump the version counter of the cached fused weight
+        self._weight_cache = None
+        return ((self(x) - output).norm() / output.norm().clamp_min(torch.finfo(output.dtype).tiny)).item()
 
     def regularization_loss(self, regularize_activation=1.0, regularize_entropy=1.0):
         """
@@ -249,6 +673,7 @@ class KAN(torch.nn.Module):
         base_activation=torch.nn.SiLU,
         grid_eps=0.02,
         grid_range=[-1, 1],
+        fused=False,
     ):
         super(KAN, self).__init__()
         self.grid_size = grid_size
@@ -268,9 +693,29 @@ class KAN(torch.nn.Module):
                     base_activation=base_activation,
                     grid_eps=grid_eps,
                     grid_range=grid_range,
+                    fused=fused,
                 )
             )
 
+    @torch.no_grad()
+    def update_grid(self, x: torch.Tensor, margin=0.01, ridge=None):
+        """
+        Adapt the grid of every layer to its inputs at the points x.
+
+        Args:
+            x (torch.Tensor): Input tensor of shape (batch_size, dim).
+            margin (float): Margin of the uniform part of the grids.
+            ridge (float): Relative ridge of the coefficient refit, None for lstsq.
+
+        Returns:
+            float: Largest relative change of the layer outputs, see KANLinear.update_grid.
+        """
+        change = 0.0
+        for layer in self.layers:
+            change = max(change, layer.update_grid(x, margin, ridge))
+            x = layer(x)
+        return change
+
     def forward(self, x: torch.Tensor, update_grid=False):
         factor = 1 - torch.sum(x**2, dim=1, keepdim=True)  # Compute factor before forward pass
         for layer in self.layers:
@@ -279,6 +724,44 @@ class KAN(torch.nn.Module):
             x = layer(x)
         return factor * x
 
+    def forward_laplacian(self, x: torch.Tensor, idx=None):
+        """
+        Forward-Laplacian pass: propagate the value, the input gradient over idx and
+        the partial Laplacian over idx through every layer with the closed-form
+        derivatives of the B-spline bases and of the base activation, without any
+        double backward. The hard constraint (1 - |x|^2) * KAN(x) is handled with the
+        product rule.
+
+        Args:
+            x (torch.Tensor): Input tensor of shape (batch_size, dim).
+            idx: Dimensions of the partial Laplacian, all dimensions if None.
+
+        Returns:
+            tuple: Value of shape (batch_size, 1), gradient of shape (batch_size, len(idx))
+                and partial Laplacian of shape (batch_size,).
+        """
+        if idx is None:
+            idx = torch.arange(x.size(1), device=x.device)
+        idx = torch.as_tensor(idx, dtype=torch.int64, device=x.device).reshape(-1)
+
+        h, grad, lap = self.layers[0].forward_laplacian(x, idx=idx)
+        for layer in self.layers[1:]:
+            h, grad, lap = layer.forward_laplacian(h, grad, lap)
+        nn_x = h  # (batch_size, 1)
+        nn_grad = grad.squeeze(-1)  # (batch_size, len(idx))
+        nn_lap = lap.squeeze(-1)  # (batch_size,)
+
+        x_idx = x[:, idx]
+        factor = 1 - torch.sum(x**2, dim=1, keepdim=True)
+        u = factor * nn_x
+        u_x = -2 * x_idx * nn_x + factor * nn_grad
+        u_lap = (
+            -2 * idx.numel() * nn_x.squeeze(-1)
+            - 4 * torch.sum(x_idx * nn_grad, 1)
+            + factor.squeeze(-1) * nn_lap
+        )
+        return u, u_x, u_lap
+
     def regularization_loss(self, regularize_activation=1.0, regularize_entropy=1.0):
         return sum(
             layer.regularization_loss(regularize_activation, regularize_entropy)
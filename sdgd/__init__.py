@@ -0,0 +1,61 @@
+from .hessian import (
+    HESSIAN_ENGINES,
+    LAPLACIAN_ENGINES,
+    PROBE_DISTRIBUTIONS,
+    hessian_diag,
+    hessian_diag_param_grads,
+    laplacian,
+    laplacian_value,
+    sample_probes,
+    hutchinson_laplacian,
+    check_hessian_engine,
+)
+from .networks import MLP
+from .sampling import TwoBodyPoissonSampler, DimensionSampler
+from .pipeline import PrefetchSampler, batch_seed
+from .evaluation import Evaluator, scratch_dir, cached_test_set
+from .metrics import METRICS_FIELDS, MetricsWriter, to_excel
+from .saga import SAGATable
+from .compiled import CompiledStep
+from .precision import PRECISIONS, PrecisionPolicy
+from .profiling import PhaseProfiler, phase
+from .checkpoint import Checkpointer, rng_state, set_rng_state
+from .distributed import init_distributed, shard, rank_seed, all_reduce_sum, GradAllReducer
+
+__all__ = [
+    "HESSIAN_ENGINES",
+    "LAPLACIAN_ENGINES",
+    "hessian_diag",
+    "hessian_diag_param_grads",
+    "laplacian",
+    "laplacian_value",
+    "PROBE_DISTRIBUTIONS",
+    "sample_probes",
+    "hutchinson_laplacian",
+    "check_hessian_engine",
+    "MLP",
+    "TwoBodyPoissonSampler",
+    "DimensionSampler",
+    "PrefetchSampler",
+    "batch_seed",
+    "Evaluator",
+    "scratch_dir",
+    "cached_test_set",
+    "METRICS_FIELDS",
+    "MetricsWriter",
+    "to_excel",
+    "SAGATable",
+    "CompiledStep",
+    "PRECISIONS",
+    "PrecisionPolicy",
+    "PhaseProfiler",
+    "phase",
+    "Checkpointer",
+    "rng_state",
+    "set_rng_state",
+    "init_distributed",
+    "shard",
+    "rank_seed",
+    "all_reduce_sum",
+    "GradAllReducer",
+]
@@ -0,0 +1,265 @@
+import argparse
+import csv
+import glob
+import itertools
+import json
+import os
+import platform
+import re
+import shlex
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# architecture name -> trainer script
+ARCHITECTURES = {
+    "mlp": "SDGD_PINN.py",
+    "kan": "SDGD_PIKAN.py",
+    "sadgd": "SADGD_PINN.py",
+}
+
+# SAGA tables above this size make sadgd run with SVRG unless extra picks --vr
+SAGA_TABLE_BUDGET = 4 * 2**30
+
+# quantities compared against a baseline, all lower is better
+COMPARED = ["steady_ms", "warmup_s", "peak_rss_mb", "time_to_target_s"]
+
+
+def _read_metrics(directory):
+    # the file name of the trainers depends on the number of parameters, so glob it
+    paths = [p for p in glob.glob(os.path.join(directory, "saved_loss_l2", "*.csv")) if not p.endswith("_profile.csv")]
+    if not paths:
+        return []
+    with open(paths[0], newline="") as f:
+        return list(csv.DictReader(f))
+
+
+def _read_profile(directory):
+    memory = {}
+    for path in glob.glob(os.path.join(directory, "saved_loss_l2", "*_profile.csv")):
+        with open(path, newline="") as f:
+            for row in csv.DictReader(f):
+                if row["phase"].startswith("peak_"):
+                    memory[row["phase"]] = float(row["total_s"])
+    return memory
+
+
+def _option(extra, name, default):
+    # last value of a trainer argument in extra, as argparse would read it
+    values = [extra[i + 1] for i, arg in enumerate(extra[:-1]) if arg == name]
+    return values[-1] if values else default
+
+
+def saga_table_bytes(dim, extra=()):
+    """
+    Size of the (dim, num_params) SAGA table of SADGD_PINN, e.g. ~0.65 GB at dim=1e3
+    and ~52 GB at dim=1e4 with the default 4-layer MLP of width 128.
+
+    Args:
+        dim (int): Dimension of the problem.
+        extra (sequence): Trainer arguments, read for --PINN_h, --PINN_L and --saga_storage.
+
+    Returns:
+        int: Bytes of the table.
+    """
+    width, depth = int(_option(extra, "--PINN_h", 128)), int(_option(extra, "--PINN_L", 4))
+    itemsize = 4 if _option(extra, "--saga_storage", "float32") == "float32" else 2
+    num_params = (dim + 1) * width + (depth - 2) * (width + 1) * width + width + 1
+    return num_params * dim * itemsize
+
+
+def _number(value):
+    return float(value) if value not in ("", None) else float("nan")
+
+
+def summarize(rows, warmup=5, target_l2=1e-2):
+    """
+    Cost figures of one training run from its metrics rows.
+
+    Args:
+        rows (list): Rows of the metrics CSV, as dicts of strings.
+        warmup (int): Leading steps counted as warm-up (allocator, caches, compilation).
+        target_l2 (float): Relative L2 error of the time-to-target.
+
+    Returns:
+        dict: steady_ms (median ms/step after warm-up), warmup_s (time of the warm-up
+            steps in excess of steady_ms), final_L2, and time_to_target_s, the wall
+            clock at the first full evaluation with L2 <= target_l2 (None if never
+            reached).
+    """
+    steps = [r for r in rows if r.get("step_time") not in ("", None)]
+    step_times = np.array([_number(r["step_time"]) for r in steps])
+    if len(step_times) == 0:
+        return {"steady_ms": None, "warmup_s": None, "final_L2": None, "time_to_target_s": None}
+    steady = np.median(step_times[warmup:] if len(step_times) > warmup else step_times)
+    warmup_s = max(0.0, float(step_times[:warmup].sum() - len(step_times[:warmup]) * steady))
+    evaluated = [r for r in rows if r.get("L2") not in ("", None)]
+    reached = [r for r in evaluated if _number(r["L2"]) <= target_l2]
+    return {
+        "steady_ms": 1e3 * float(steady),
+        "warmup_s": warmup_s,
+        "final_L2": _number(evaluated[-1]["L2"]) if evaluated else None,
+        "time_to_target_s": _number(reached[0]["time"]) if reached else None,
+    }
+
+
+def run_point(arch, dim, batch_size, N_f, epochs=50, eval_every=10, N_test=2000, warmup=5, target_l2=1e-2,
+              extra=(), timeout=3600, test_cache=""):
+    """
+    Train one configuration on the CPU in a scratch directory and measure it.
+
+    Args:
+        arch (str): Key of ARCHITECTURES.
+        dim (int): Dimension of the problem.
+        batch_size (int): Sampled dimensions per step, clipped to dim.
+        N_f (int): Residual points per step.
+        epochs (int): Fixed training budget.
+        eval_every (int): Epochs between two full test evaluations.
+        N_test (int): Test points.
+        warmup (int): Leading steps counted as warm-up.
+        target_l2 (float): Relative L2 error of the time-to-target.
+        extra (sequence): Further trainer arguments, for instance ["--hessian_engine", "jvp_vjp"].
+            sadgd gets "--vr svrg --method 4" with N_f anchor points when its SAGA table
+            exceeds SAGA_TABLE_BUDGET, unless extra sets --vr.
+        timeout (float): Seconds before the run is abandoned.
+        test_cache (str): Test set cache directory shared by the runs, empty to regenerate.
+
+    Returns:
+        dict: Configuration, summarize() figures, peak memory in MB and the wall
+            time of the process, or an "error" entry if the run failed.
+    """
+    batch_size = min(batch_size, dim)
+    if arch == "sadgd" and "--vr" not in extra and saga_table_bytes(dim, extra) > SAGA_TABLE_BUDGET:
+        # the anchor gradient is accumulated over chunks of --svrg_chunk dimensions on --svrg_N_f points
+        extra = ["--vr", "svrg", "--method", "4", "--svrg_N_f", str(N_f)] + list(extra)
+    result = {"arch": arch, "dim": dim, "batch_size": batch_size, "N_f": N_f, "epochs": epochs, "extra": list(extra)}
+    command = [
+        sys.executable, os.path.join(ROOT, ARCHITECTURES[arch]),
+        "--Name", "bench_" + arch, "--device", "cpu", "--dim", str(dim), "--batch_size", str(batch_size),
+        "--N_f", str(N_f), "--epochs", str(epochs), "--eval_every", str(eval_every), "--N_test", str(N_test),
+        "--profile", "1", "--test_cache", os.path.abspath(test_cache) if test_cache else "",
+    ] + list(extra)
+    with tempfile.TemporaryDirectory(prefix="sdgd_bench_") as directory:
+        start = time.perf_counter()
+        try:
+            process = subprocess.run(command, cwd=directory, capture_output=True, text=True, timeout=timeout)
+        except subprocess.TimeoutExpired:
+            result["error"] = "timeout after %d s" % timeout
+            return result
+        result["wall_s"] = time.perf_counter() - start
+        if process.returncode != 0:
+            result["error"] = process.stderr.strip().splitlines()[-1] if process.stderr.strip() else "exit code %d" % process.returncode
+            return result
+        result.update(summarize(_read_metrics(directory), warmup, target_l2))
+        result.update(_read_profile(directory))
+    compiled = re.search(r"compile ([0-9.]+) s", process.stdout)
+    if compiled:
+        result["compile_s"] = float(compiled.group(1))
+    return result
+
+
+def _key(result):
+    return (result["arch"], result["dim"], result["batch_size"], result["N_f"], tuple(result.get("extra", ())))
+
+
+def compare(results, baseline, tolerance=0.2):
+    """
+    Flag the points of results that are slower or bigger than the same points of a
+    baseline by more than tolerance, or that no longer reach the target.
+
+    Args:
+        results (list): run_point() results.
+        baseline (list): run_point() results of the reference run.
+        tolerance (float): Allowed relative increase.
+
+    Returns:
+        list: One dict (point, metric, baseline, current, ratio) per regression.
+    """
+    reference = {_key(r): r for r in baseline}
+    regressions = []
+    for result in results:
+        base = reference.get(_key(result))
+        if base is None or "error" in base:
+            continue
+        point = {k: result[k] for k in ("arch", "dim", "batch_size", "N_f")}
+        if "error" in result:
+            regressions.append({"point": point, "metric": "error", "baseline": None, "current": result["error"], "ratio": None})
+            continue
+        for metric in COMPARED:
+            old, new = base.get(metric), result.get(metric)
+            if old is None:
+                continue
+            if new is None: # the target was reached by the baseline only
+                regressions.append({"point": point, "metric": metric, "baseline": old, "current": None, "ratio": None})
+            elif old > 0 and new > (1 + tolerance) * old:
+                regressions.append({"point": point, "metric": metric, "baseline": old, "current": new, "ratio": new / old})
+    return regressions
+
+
+def environment():
+    import torch
+
+    return {
+        "python": platform.python_version(),
+        "torch": torch.__version__,
+        "machine": platform.machine(),
+        "processor": platform.processor(),
+        "cpu_count": os.cpu_count(),
+        "torch_threads": torch.get_num_threads(),
+    }
+
+
+def _ints(text):
+    return [int(float(v)) for v in text.split(",")]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="SDGD cost scaling versus dimension, batch size and architecture")
+    parser.add_argument("--archs", type=str, default="mlp,kan,sadgd") # comma-separated keys of ARCHITECTURES
+    parser.add_argument("--dims", type=str, default="10,100,1000,10000")
+    parser.add_argument("--batch_sizes", type=str, default="10")
+    parser.add_argument("--N_fs", type=str, default="100")
+    parser.add_argument("--epochs", type=int, default=50) # fixed budget of every point
+    parser.add_argument("--eval_every", type=int, default=10)
+    parser.add_argument("--N_test", type=int, default=2000)
+    parser.add_argument("--warmup", type=int, default=5) # leading steps counted as warm-up
+    parser.add_argument("--target_l2", type=float, default=1e-2)
+    parser.add_argument("--extra", type=str, default="") # further trainer arguments, e.g. "--hessian_engine jvp_vjp"
+    parser.add_argument("--timeout", type=float, default=3600) # seconds per point
+    parser.add_argument("--test_cache", type=str, default="") # shared test set cache directory
+    parser.add_argument("--output", type=str, default="results/benchmark.json")
+    parser.add_argument("--baseline", type=str, default="") # JSON of a previous run to compare with
+    parser.add_argument("--tolerance", type=float, default=0.2) # allowed relative slowdown before a regression is flagged
+    args = parser.parse_args()
+
+    extra = shlex.split(args.extra)
+    results = []
+    for arch, dim, batch_size, N_f in itertools.product(args.archs.split(","), _ints(args.dims), _ints(args.batch_sizes), _ints(args.N_fs)):
+        result = run_point(arch, dim, batch_size, N_f, args.epochs, args.eval_every, args.N_test, args.warmup,
+                           args.target_l2, extra, args.timeout, args.test_cache)
+        results.append(result)
+        if "error" in result:
+            print("%-6s dim=%-6d batch=%-4d N_f=%-5d failed: %s" % (arch, dim, result["batch_size"], N_f, result["error"]))
+        else:
+            print("%-6s dim=%-6d batch=%-4d N_f=%-5d %9.3f ms/step, warm-up %.2f s, peak RSS %.0f MB" % (
+                arch, dim, result["batch_size"], N_f, result["steady_ms"], result["warmup_s"], result.get("peak_rss_mb", float("nan"))))
+
+    report = {"environment": environment(), "config": vars(args), "results": results}
+    if args.baseline:
+        with open(args.baseline) as f:
+            report["regressions"] = compare(results, json.load(f)["results"], args.tolerance)
+        for regression in report["regressions"]:
+            print("REGRESSION", json.dumps(regression))
+    directory = os.path.dirname(args.output)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=1)
+    print("Results written to", args.output)
+    sys.exit(1 if report.get("regressions") else 0)
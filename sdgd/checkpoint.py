@@ -0,0 +1,128 @@
+import os
+import shutil
+import threading
+
+import numpy as np
+import torch
+
+
+def rng_state():
+    """
+    Returns:
+        dict: Global NumPy, torch CPU and, if available, CUDA random states.
+    """
+    state = {"numpy": np.random.get_state(), "torch": torch.get_rng_state()}
+    if torch.cuda.is_available():
+        state["cuda"] = torch.cuda.get_rng_state_all()
+    return state
+
+
+def set_rng_state(state):
+    """
+    Restore the global random states saved by rng_state.
+    """
+    np.random.set_state(state["numpy"])
+    torch.set_rng_state(state["torch"])
+    if "cuda" in state and torch.cuda.is_available():
+        torch.cuda.set_rng_state_all(state["cuda"])
+
+
+def _snapshot(obj):
+    # copy every tensor to the CPU so that training can go on while the copy is written
+    if isinstance(obj, torch.Tensor):
+        return obj.detach().to("cpu", copy=True)
+    if isinstance(obj, np.ndarray):
+        return np.array(obj)
+    if isinstance(obj, dict):
+        return {key: _snapshot(value) for key, value in obj.items()}
+    if isinstance(obj, (list, tuple)):
+        return type(obj)(_snapshot(value) for value in obj)
+    return obj
+
+
+class Checkpointer:
+    """
+    Periodic checkpoints written asynchronously and atomically.
+
+    save() first snapshots the state to CPU memory on the calling thread, then writes
+    it with torch.save from a background thread to path + ".tmp" and renames the file
+    over path, so that path always holds a complete checkpoint. A new save waits for
+    the previous write to finish. Files too large to snapshot in memory, such as a
+    memory-mapped SAGA table, are copied next to the checkpoint with attach().
+    """
+
+    def __init__(self, path):
+        self.path = path
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._thread = None
+        self._error = None
+        self._attached = [] # files of the checkpoint on disk
+        self._pending = [] # files of the next checkpoint
+
+    def _write(self, state):
+        try:
+            tmp = self.path + ".tmp"
+            torch.save(state, tmp)
+            os.replace(tmp, self.path)
+            # the files of the previous checkpoint are only removed once the new one is complete
+            for path in set(self._attached) - set(state["attached_files"]):
+                if os.path.exists(path):
+                    os.remove(path)
+            self._attached = state["attached_files"]
+        except Exception as e:
+            self._error = e
+
+    def attach(self, src, tag):
+        """
+        Copy a file to the checkpoint directory for the next save(), streaming it on
+        disk instead of snapshotting it in memory. The file must not change during
+        the copy, the copy is removed when a later checkpoint is complete.
+
+        Args:
+            src (str): File to copy, flushed by the caller.
+            tag: Distinguishes the copy from those of other checkpoints, e.g. the epoch.
+
+        Returns:
+            str: Path of the copy, to be stored in the state.
+        """
+        self.wait()
+        root, ext = os.path.splitext(os.path.basename(src))
+        dst = "%s.%s_%s%s" % (self.path, root, tag, ext)
+        shutil.copyfile(src, dst + ".tmp")
+        os.replace(dst + ".tmp", dst)
+        self._pending.append(dst)
+        return dst
+
+    def save(self, state):
+        """
+        Args:
+            state (dict): Nested dict of tensors, arrays and Python objects.
+        """
+        state = _snapshot(state)
+        state["attached_files"], self._pending = self._pending, []
+        self.wait()
+        self._thread = threading.Thread(target=self._write, args=(state,), daemon=True)
+        self._thread.start()
+
+    def wait(self):
+        """
+        Block until the last checkpoint is on disk.
+        """
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        if self._error is not None:
+            raise RuntimeError("checkpoint write to %s failed" % self.path) from self._error
+
+    def load(self, map_location=None):
+        """
+        Returns:
+            dict: Last complete checkpoint, None if there is none yet.
+        """
+        if not os.path.exists(self.path):
+            return None
+        state = torch.load(self.path, map_location=map_location, weights_only=False)
+        self._attached = state.get("attached_files", [])
+        return state
@@ -0,0 +1,81 @@
+import time
+
+import torch
+from torch.func import functional_call, grad_and_value
+
+
+class _Loss(torch.nn.Module):
+    # holds net as a submodule so functional_call can swap its parameters
+    def __init__(self, net, loss_fn):
+        super(_Loss, self).__init__()
+        self.net = net
+        self.loss_fn = loss_fn
+
+    def forward(self, *inputs):
+        return self.loss_fn(self.net, *inputs)
+
+
+class CompiledStep:
+    """
+    One torch.compile'd training step: the residual loss, its parameter gradient and
+    the optimizer update are traced into a single graph.
+
+    loss_fn(net, *inputs) must return (loss, saved_loss) and only use torch.func
+    compatible operations (no torch.autograd.grad, no NumPy). The gradient is taken
+    with torch.func.grad_and_value over the parameters of net, written to the .grad of
+    the parameters and applied by optimizer.step() inside the same graph. Every input
+    must keep the same shape from one call to the next (pass the sampled dimensions as
+    an int64 tensor of fixed length), and the optimizer should be built with a tensor
+    lr so that scheduler updates do not trigger recompiles.
+    """
+
+    def __init__(self, net, optimizer, loss_fn, backend="inductor", mode=None, fullgraph=True):
+        self.optimizer = optimizer
+        self.loss = _Loss(net, loss_fn)
+        self.params = {"net." + name: p for name, p in net.named_parameters()}
+        self.step_times = []
+        self._step = torch.compile(self._eager_step, backend=backend, mode=mode, fullgraph=fullgraph)
+
+    def _eager_step(self, *inputs):
+        params = {name: p.detach() for name, p in self.params.items()}
+        loss = lambda params: functional_call(self.loss, params, inputs)
+        grads, (loss, saved_loss) = grad_and_value(loss, has_aux=True)(params)
+        for name, p in self.params.items():
+            p.grad = grads[name]
+        self.optimizer.step()
+        return saved_loss
+
+    def __call__(self, *inputs):
+        """
+        Run one training step.
+
+        Returns:
+            torch.Tensor: saved_loss of loss_fn.
+        """
+        start = time.perf_counter()
+        saved_loss = self._step(*inputs)
+        if saved_loss.is_cuda:
+            torch.cuda.synchronize()
+        self.step_times.append(time.perf_counter() - start)
+        return saved_loss
+
+    def summary(self, warmup=2):
+        """
+        Split the step times into compilation and steady state. The first call traces
+        and compiles the graph, the second one may recompile once the optimizer state
+        exists, the steady-state time is the median of the remaining calls.
+
+        Args:
+            warmup (int): Number of calls excluded from the steady state.
+
+        Returns:
+            dict: first_step and compile times in s, steady time in ms/step.
+        """
+        times = torch.tensor(self.step_times, dtype=torch.float64)
+        steady = times[warmup:].median().item() if len(times) > warmup else float("nan")
+        first = times[0].item() if len(times) else float("nan")
+        return {
+            "first_step": first,
+            "compile": times[:warmup].sum().item() - min(warmup, len(times)) * steady,
+            "steady": 1e3 * steady,
+        }
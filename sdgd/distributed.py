@@ -0,0 +1,109 @@
+import os
+
+import numpy as np
+import torch
+import torch.distributed as dist
+
+
+def init_distributed(backend="gloo"):
+    """
+    Join the process group set up by torchrun, or run as a single process when the
+    script was started without it.
+
+    Args:
+        backend (str): torch.distributed backend, gloo for CPU processes.
+
+    Returns:
+        tuple: Rank and world size.
+    """
+    if int(os.environ.get("WORLD_SIZE", 1)) == 1:
+        return 0, 1
+    dist.init_process_group(backend)
+    return dist.get_rank(), dist.get_world_size()
+
+
+def shard(n, rank, world_size):
+    """
+    Part of rank in a split of range(n) into world_size contiguous, near-equal parts.
+
+    Returns:
+        slice: Indices of rank.
+    """
+    return slice(rank * n // world_size, (rank + 1) * n // world_size)
+
+
+def rank_seed(seed, rank):
+    """
+    Seed of the private random stream of a rank, independent of the shared seed.
+
+    Returns:
+        int: 32-bit seed for np.random.RandomState and torch.Generator.
+    """
+    return int(np.random.SeedSequence([seed, rank]).generate_state(1)[0])
+
+
+class _SumAcrossRanks(torch.autograd.Function):
+    @staticmethod
+    def forward(ctx, x):
+        x = x.clone()
+        dist.all_reduce(x)
+        return x
+
+    @staticmethod
+    def backward(ctx, grad):
+        return grad
+
+
+def all_reduce_sum(x: torch.Tensor):
+    """
+    Differentiable sum of x over all ranks, for a loss that every rank computes from
+    the same summed tensor. The backward pass hands the local upstream gradient to the
+    local term, so the parameter gradient of each rank only covers its own term and
+    the full gradient is the sum over ranks (GradAllReducer with average=False).
+
+    Args:
+        x (torch.Tensor): Partial result of this rank.
+
+    Returns:
+        torch.Tensor: Sum over ranks, x itself in a single process.
+    """
+    if not dist.is_initialized():
+        return x
+    return _SumAcrossRanks.apply(x)
+
+
+class GradAllReducer:
+    """
+    Average (or sum, with average=False) the .grad of params over all ranks with a
+    single all_reduce of one flat buffer instead of one collective per parameter.
+    A no-op in a single process.
+    """
+
+    def __init__(self, params, average=True):
+        self.params = list(params)
+        self.average = average
+        self.world_size = dist.get_world_size() if dist.is_initialized() else 1
+        num_params = sum(p.numel() for p in self.params)
+        self.flat = torch.zeros(num_params, dtype=self.params[0].dtype, device=self.params[0].device)
+
+    def broadcast(self, src=0):
+        """
+        Copy the parameters of rank src to every rank.
+        """
+        if self.world_size == 1:
+            return
+        with torch.no_grad():
+            for p in self.params:
+                dist.broadcast(p.data, src)
+
+    def __call__(self):
+        if self.world_size == 1:
+            return
+        torch.cat([p.grad.reshape(-1) for p in self.params], out=self.flat)
+        dist.all_reduce(self.flat)
+        if self.average:
+            self.flat.div_(self.world_size)
+        offset = 0
+        for p in self.params:
+            p.grad.copy_(self.flat[offset : offset + p.numel()].view_as(p))
+            offset += p.numel()
@@ -0,0 +1,139 @@
+import atexit
+import hashlib
+import json
+import os
+import pickle
+import shutil
+import tempfile
+
+import numpy as np
+import torch
+
+
+def scratch_dir(prefix="sdgd_test_"):
+    """
+    Temporary directory for memory-mapped arrays of this run, removed with its
+    content when the interpreter exits.
+
+    Returns:
+        str: Path of the directory.
+    """
+    directory = tempfile.TemporaryDirectory(prefix=prefix)
+    atexit.register(directory.cleanup)
+    return directory.name
+
+
+def cached_test_set(make, cache_dir, **key):
+    """
+    Content-addressed store of a NumPy test set. The entry of key lives in
+    cache_dir/<hash of key>/ as x.npy and u.npy together with the global NumPy random
+    state left by make, so that a cache hit leaves the random stream exactly where
+    a regeneration would have left it. Entries are written to a temporary directory
+    and renamed into place, concurrent runs may share cache_dir.
+
+    Args:
+        make: Function writing x.npy and u.npy into the directory it is given,
+            called on a cache miss.
+        cache_dir (str): Root directory of the cache.
+        **key: Every parameter the test set depends on.
+
+    Returns:
+        tuple: Read-only memory maps of x and u, streamed by Evaluator.
+    """
+    digest = hashlib.sha256(json.dumps(key, sort_keys=True).encode()).hexdigest()[:16]
+    directory = os.path.join(cache_dir, digest)
+    if not os.path.exists(os.path.join(directory, "rng.pkl")):
+        os.makedirs(cache_dir, exist_ok=True)
+        tmp = tempfile.mkdtemp(prefix=digest + ".", dir=cache_dir)
+        make(tmp)
+        with open(os.path.join(tmp, "key.json"), "w") as f:
+            json.dump(key, f, sort_keys=True)
+        with open(os.path.join(tmp, "rng.pkl"), "wb") as f:
+            pickle.dump(np.random.get_state(), f)
+        try:
+            os.rename(tmp, directory)
+        except OSError: # another run stored the same entry first
+            shutil.rmtree(tmp, ignore_errors=True)
+    else:
+        with open(os.path.join(directory, "rng.pkl"), "rb") as f:
+            np.random.set_state(pickle.load(f))
+    return np.load(os.path.join(directory, "x.npy"), mmap_mode="r"), np.load(os.path.join(directory, "u.npy"), mmap_mode="r")
+
+
+class Evaluator:
+    """
+    Relative L2/L1 errors of net on the test set, computed in fixed-size chunks under
+    torch.inference_mode so that the full test set never sits in one activation buffer.
+
+    x and u may be tensors or NumPy arrays. NumPy memory maps are kept on disk and
+    streamed chunk by chunk, other arrays are moved to device once.
+    """
+
+    def __init__(self, net, x, u, chunk_size=4096, subsample=0, device=None, dtype=torch.float32, seed=0):
+        self.net = net
+        self.chunk_size = chunk_size
+        self.subsample = subsample
+        self.device = torch.device(device) if device is not None else torch.device("cpu")
+        self.dtype = dtype
+        self.streaming = isinstance(x, np.memmap)
+        if self.streaming:
+            self.x, self.u = x, np.asarray(u).reshape(-1)
+        else:
+            self.x = torch.as_tensor(np.asarray(x), dtype=dtype).to(self.device)
+            self.u = torch.as_tensor(np.asarray(u), dtype=dtype).to(self.device).reshape(-1)
+        self.num_test = self.x.shape[0]
+        self.generator = np.random.default_rng(seed)
+
+    def _chunk(self, array, start, stop):
+        if not self.streaming:
+            return array[start:stop]
+        return torch.as_tensor(np.ascontiguousarray(array[start:stop]), dtype=self.dtype).to(self.device)
+
+    def _errors(self, x, u):
+        pred_u = self.net(x).reshape(-1).to(u.dtype)
+        err = u - pred_u
+        return torch.stack([err.square().sum(), u.square().sum(), err.abs().sum(), u.abs().sum()])
+
+    @torch.inference_mode()
+    def predict(self):
+        """
+        Returns:
+            torch.Tensor: Predictions on the whole test set of shape (num_test,).
+        """
+        chunks = []
+        for start in range(0, self.num_test, self.chunk_size):
+            stop = min(start + self.chunk_size, self.num_test)
+            chunks.append(self.net(self._chunk(self.x, start, stop)).reshape(-1))
+        return torch.cat(chunks)
+
+    @torch.inference_mode()
+    def full(self):
+        """
+        Returns:
+            tuple: Relative L2 and L1 errors on the whole test set.
+        """
+        sums = 0
+        for start in range(0, self.num_test, self.chunk_size):
+            stop = min(start + self.chunk_size, self.num_test)
+            sums = sums + self._errors(self._chunk(self.x, start, stop), self._chunk(self.u, start, stop))
+        L2, L1 = (sums[0] / sums[1]).sqrt(), sums[2] / sums[3]
+        return L2.item(), L1.item()
+
+    @torch.inference_mode()
+    def rolling(self):
+        """
+        Cheap estimate of the errors on a random subsample of the test set.
+
+        Returns:
+            tuple: Estimated relative L2 and L1 errors.
+        """
+        idx = np.sort(self.generator.choice(self.num_test, min(self.subsample, self.num_test), replace=False))
+        if self.streaming:
+            x = torch.as_tensor(self.x[idx], dtype=self.dtype).to(self.device)
+            u = torch.as_tensor(self.u[idx], dtype=self.dtype).to(self.device)
+        else:
+            idx = torch.as_tensor(idx, device=self.device)
+            x, u = self.x[idx], self.u[idx]
+        sums = self._errors(x, u)
+        L2, L1 = (sums[0] / sums[1]).sqrt(), sums[2] / sums[3]
+        return L2.item(), L1.item()
@@ -0,0 +1,227 @@
+import torch
+from torch.func import functional_call, grad, jvp, vmap
+
+from .profiling import phase
+
+
+HESSIAN_ENGINES = ["loop", "jvp_vjp", "jvp_jvp"]
+LAPLACIAN_ENGINES = HESSIAN_ENGINES + ["forward_laplacian"]
+PROBE_DISTRIBUTIONS = ["rademacher", "gaussian"]
+
+
+def _one_hot_tangents(x: torch.Tensor, idx: torch.Tensor):
+    """
+    Build one tangent per sampled dimension.
+
+    Args:
+        x (torch.Tensor): Input tensor of shape (batch_size, dim).
+        idx (torch.Tensor): Sampled dimensions of shape (num_idx,).
+
+    Returns:
+        torch.Tensor: One-hot tangents of shape (num_idx, batch_size, dim).
+    """
+    tangents = x.new_zeros(idx.numel(), *x.shape)
+    tangents[torch.arange(idx.numel(), device=x.device), :, idx] = 1
+    return tangents
+
+
+def hessian_diag(net, x: torch.Tensor, idx, engine="loop"):
+    """
+    Compute the sampled diagonal entries d2u/dxi2 of the input Hessian of net.
+
+    The "loop" engine issues one double-backward call per sampled dimension.
+    The torch.func engines vmap over one-hot tangents and return every entry in a
+    single call, either as forward-over-reverse ("jvp_vjp") or forward-over-forward
+    ("jvp_jvp") derivatives. All engines keep the graph w.r.t. the parameters of net.
+
+    Args:
+        net (torch.nn.Module): Network mapping (batch_size, dim) to (batch_size, 1).
+        x (torch.Tensor): Input tensor of shape (batch_size, dim).
+        idx: Sampled dimensions, any sequence of ints or an int64 tensor.
+        engine (str): One of HESSIAN_ENGINES.
+
+    Returns:
+        torch.Tensor: Hessian diagonal tensor of shape (batch_size, len(idx)).
+    """
+    if engine == "loop":
+        with phase("forward"):
+            x.requires_grad_()
+            f = net(x)
+        with phase("first_derivative"):
+            u_x = torch.autograd.grad(f.sum(), x, create_graph=True)[0]
+        with phase("hvp"):
+            u_xx = []
+            for i in idx:
+                d2f_dxidxi = torch.autograd.grad(u_x[:, i].sum(), x, create_graph=True)[0][:, i]
+                u_xx.append(d2f_dxidxi)
+            return torch.stack(u_xx, dim=1)
+
+    idx = torch.as_tensor(idx, dtype=torch.int64, device=x.device).reshape(-1)
+    x = x.detach()
+    tangents = _one_hot_tangents(x, idx)
+    # the vmapped engines run the forward and both derivative passes together
+    if engine == "jvp_vjp":
+        u_x = grad(lambda y: net(y).sum())
+        with phase("hvp"):
+            hvp = vmap(lambda v: jvp(u_x, (x,), (v,))[1])(tangents)  # (num_idx, batch_size, dim)
+        return hvp[torch.arange(idx.numel(), device=x.device), :, idx].T
+    elif engine == "jvp_jvp":
+        u = lambda y: net(y).squeeze(-1)
+        u_v = lambda y, v: jvp(u, (y,), (v,))[1]
+        with phase("hvp"):
+            vhv = vmap(lambda v: jvp(lambda y: u_v(y, v), (x,), (v,))[1])(tangents)  # (num_idx, batch_size)
+        return vhv.T
+    raise ValueError("Unknown hessian engine %s, expected one of %s" % (engine, HESSIAN_ENGINES))
+
+
+def hessian_diag_param_grads(net, x: torch.Tensor, idx, weight: torch.Tensor):
+    """
+    Per-dimension parameter gradients of mean(weight * d2u/dxi2), one for each sampled
+    dimension, computed in a single vmapped pass (vmap of torch.func.grad over the
+    one-hot tangents of a jvp-over-jvp second derivative).
+
+    Args:
+        net (torch.nn.Module): Network mapping (batch_size, dim) to (batch_size, 1).
+        x (torch.Tensor): Input tensor of shape (batch_size, dim).
+        idx: Sampled dimensions, any sequence of ints or an int64 tensor.
+        weight (torch.Tensor): Per-point weights of shape (batch_size,).
+
+    Returns:
+        torch.Tensor: Flat gradients of shape (len(idx), num_params), the parameters being
+            ordered as in net.parameters().
+    """
+    idx = torch.as_tensor(idx, dtype=torch.int64, device=x.device).reshape(-1)
+    x, weight = x.detach(), weight.detach()
+    params = {name: p.detach() for name, p in net.named_parameters()}
+    tangents = _one_hot_tangents(x, idx)
+
+    def weighted_u_xx(params, v):
+        u = lambda y: functional_call(net, params, (y,)).squeeze(-1)
+        u_xx = jvp(lambda y: jvp(u, (y,), (v,))[1], (x,), (v,))[1]
+        return torch.mean(weight * u_xx)
+
+    with phase("per_dim_grads"):
+        grads = vmap(grad(weighted_u_xx), in_dims=(None, 0))(params, tangents)
+    return torch.cat([grads[name].reshape(idx.numel(), -1) for name in params], dim=1)
+
+
+def laplacian(net, x: torch.Tensor, idx, engine="loop"):
+    """
+    Compute the partial Laplacian sum_{i in idx} d2u/dxi2 of net.
+
+    The "forward_laplacian" engine requires net to provide forward_laplacian(x, idx),
+    every other engine sums the output of hessian_diag.
+
+    Args:
+        net (torch.nn.Module): Network mapping (batch_size, dim) to (batch_size, 1).
+        x (torch.Tensor): Input tensor of shape (batch_size, dim).
+        idx: Sampled dimensions, any sequence of ints or an int64 tensor.
+        engine (str): One of LAPLACIAN_ENGINES.
+
+    Returns:
+        torch.Tensor: Partial Laplacian tensor of shape (batch_size,).
+    """
+    if engine == "forward_laplacian":
+        if not hasattr(net, "forward_laplacian"):
+            raise ValueError("%s does not support the forward_laplacian engine" % type(net).__name__)
+        with phase("forward_laplacian"):
+            return net.forward_laplacian(x.detach(), idx)[2]
+    return torch.sum(hessian_diag(net, x, idx, engine), dim=1)
+
+
+@torch.no_grad()
+def laplacian_value(net, x: torch.Tensor, idx=None, chunk_size=64):
+    """
+    Partial Laplacian without any autograd graph, for residuals that are not
+    backpropagated. Uses net.forward_laplacian when available, otherwise the
+    jvp-over-vjp engine over chunks of chunk_size dimensions to bound memory.
+
+    Args:
+        net (torch.nn.Module): Network mapping (batch_size, dim) to (batch_size, 1).
+        x (torch.Tensor): Input tensor of shape (batch_size, dim).
+        idx: Dimensions of the partial Laplacian, all dimensions if None.
+        chunk_size (int): Dimensions per jvp-over-vjp call.
+
+    Returns:
+        torch.Tensor: Partial Laplacian tensor of shape (batch_size,).
+    """
+    if idx is None:
+        idx = torch.arange(x.size(1), device=x.device)
+    idx = torch.as_tensor(idx, dtype=torch.int64, device=x.device).reshape(-1)
+    x = x.detach()
+    with phase("full_residual"):
+        if hasattr(net, "forward_laplacian"):
+            return net.forward_laplacian(x, idx)[2]
+        u_lap = 0
+        for start in range(0, idx.numel(), chunk_size):
+            u_lap = u_lap + torch.sum(hessian_diag(net, x, idx[start : start + chunk_size], "jvp_vjp"), dim=1)
+        return u_lap
+
+
+def sample_probes(x: torch.Tensor, num_probes, distribution="rademacher", generator=None):
+    """
+    Draw probe vectors v with E[v v^T] = I for the Hutchinson trace estimator.
+
+    Args:
+        x (torch.Tensor): Input tensor of shape (batch_size, dim).
+        num_probes (int): Number of probes per point.
+        distribution (str): One of PROBE_DISTRIBUTIONS.
+        generator (torch.Generator): Optional source of randomness.
+
+    Returns:
+        torch.Tensor: Probe tensor of shape (num_probes, batch_size, dim).
+    """
+    shape = (num_probes, *x.shape)
+    if distribution == "rademacher":
+        probes = torch.randint(0, 2, shape, generator=generator, device=x.device)
+        return (2 * probes - 1).to(x.dtype)
+    elif distribution == "gaussian":
+        return torch.randn(shape, generator=generator, device=x.device, dtype=x.dtype)
+    raise ValueError("Unknown probe distribution %s, expected one of %s" % (distribution, PROBE_DISTRIBUTIONS))
+
+
+def hutchinson_laplacian(net, x: torch.Tensor, probes: torch.Tensor):
+    """
+    Estimate the Laplacian of net with one Hessian-vector product per probe:
+    v^T H v is an unbiased estimate of tr(H) for every probe v.
+
+    Args:
+        net (torch.nn.Module): Network mapping (batch_size, dim) to (batch_size, 1).
+        x (torch.Tensor): Input tensor of shape (batch_size, dim).
+        probes (torch.Tensor): Probe tensor of shape (num_probes, batch_size, dim).
+
+    Returns:
+        torch.Tensor: Per-probe estimates of shape (num_probes, batch_size).
+    """
+    with phase("forward"):
+        x.requires_grad_()
+        f = net(x)
+    with phase("first_derivative"):
+        u_x = torch.autograd.grad(f.sum(), x, create_graph=True)[0]
+    with phase("hvp"):
+        vhv = []
+        for v in probes:
+            hv = torch.autograd.grad(torch.sum(u_x * v), x, create_graph=True)[0]
+            vhv.append(torch.sum(hv * v, dim=1))
+        return torch.stack(vhv, dim=0)
+
+
+def check_hessian_engine(net, x: torch.Tensor, idx, engine, rtol=1e-4, atol=1e-5):
+    """
+    Compare an engine against the reference "loop" engine, on the Hessian diagonal
+    for the engines of HESSIAN_ENGINES and on the partial Laplacian otherwise.
+
+    Args:
+        net (torch.nn.Module): Network mapping (batch_size, dim) to (batch_size, 1).
+        x (torch.Tensor): Input tensor of shape (batch_size, dim).
+        idx: Sampled dimensions.
+        engine (str): Engine to check.
+
+    Returns:
+        float: Maximum absolute deviation from the loop engine.
+    """
+    compute = hessian_diag if engine in HESSIAN_ENGINES else laplacian
+    ref = compute(net, x.detach().clone(), idx, "loop").detach()
+    out = compute(net, x.detach().clone(), idx, engine).detach()
+    torch.testing.assert_close(out, ref, rtol=rtol, atol=atol)
+    return (out - ref).abs().max().item()
@@ -0,0 +1,115 @@
+import argparse
+import csv
+import os
+import queue
+import threading
+import time
+
+
+METRICS_FIELDS = ["epoch", "time", "step_time", "loss", "L2", "L1", "L2_est", "L1_est"]
+
+
+class MetricsWriter:
+    """
+    Append-only CSV sink of the training metrics, one row per epoch.
+
+    log() only queues the row: a background thread appends the rows to the file and
+    flushes it every flush_every rows or flush_interval seconds, so the training loop
+    never waits on the disk and a crash loses at most the unflushed tail. Fields that
+    are missing from a row (for instance L2 between two evaluations) are left empty
+    and read back as NaN. A resumed run passes keep_rows, the number of rows logged up
+    to its checkpoint: later rows of the interrupted run are dropped and the new ones
+    appended.
+    """
+
+    _CLOSE = object()
+
+    def __init__(self, path, fields=METRICS_FIELDS, flush_every=100, flush_interval=10.0, keep_rows=None):
+        self.path = path
+        self.fields = list(fields)
+        self.flush_every = flush_every
+        self.flush_interval = flush_interval
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        append = keep_rows is not None and os.path.exists(path)
+        if append:
+            with open(path, newline="") as f:
+                lines = f.readlines()[: 1 + keep_rows]
+            with open(path, "w", newline="") as f:
+                f.writelines(lines)
+        self._file = open(path, "a" if append else "w", newline="")
+        self._writer = csv.writer(self._file)
+        if not append:
+            self._writer.writerow(self.fields)
+            self._file.flush()
+        self.rows = len(lines) - 1 if append else 0
+        self._queue = queue.Queue()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def log(self, **row):
+        """
+        Queue one row, keyed by field name.
+        """
+        self._queue.put([row.get(name, "") for name in self.fields])
+        self.rows += 1
+
+    def _run(self):
+        pending, last_flush = 0, time.monotonic()
+        while True:
+            try:
+                item = self._queue.get(timeout=self.flush_interval)
+            except queue.Empty:
+                item = None
+            if isinstance(item, list):
+                self._writer.writerow(item)
+                pending += 1
+            if item is self._CLOSE or isinstance(item, threading.Event) or (
+                pending and (pending >= self.flush_every or time.monotonic() - last_flush >= self.flush_interval)
+            ):
+                self._file.flush()
+                pending, last_flush = 0, time.monotonic()
+            if isinstance(item, threading.Event):
+                item.set()
+            if item is self._CLOSE:
+                return
+
+    def flush(self):
+        """
+        Block until every queued row is on disk.
+        """
+        done = threading.Event()
+        self._queue.put(done)
+        done.wait()
+
+    def close(self):
+        self._queue.put(self._CLOSE)
+        self._thread.join()
+        self._file.close()
+
+
+def to_excel(path, excel_path=None):
+    """
+    Offline conversion of a metrics CSV to the .xlsx layout of the former end-of-run dump.
+
+    Args:
+        path (str): Metrics CSV written by MetricsWriter.
+        excel_path (str): Output file, path with an .xlsx suffix if None.
+
+    Returns:
+        str: Path of the Excel file.
+    """
+    import pandas as pd
+
+    if excel_path is None:
+        excel_path = os.path.splitext(path)[0] + ".xlsx"
+    pd.read_csv(path).to_excel(excel_path, index=False)
+    return excel_path
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Convert metrics CSV files to Excel")
+    parser.add_argument("paths", nargs="+")
+    for path in parser.parse_args().paths:
+        print(to_excel(path))
@@ -0,0 +1,64 @@
+import torch
+import torch.nn as nn
+
+
+class MLP(nn.Module):
+    def __init__(self, layers:list):
+        super(MLP, self).__init__()
+        models = []
+        for i in range(len(layers)-1):
+            models.append(nn.Linear(layers[i], layers[i+1]))
+            if i != len(layers)-2:
+                models.append(nn.Tanh())
+        self.nn = nn.Sequential(*models)
+    def forward(self, x):
+        return ((1 - torch.sum(x**2, 1, keepdims=True)) * self.nn(x))
+
+    def forward_laplacian(self, x: torch.Tensor, idx=None):
+        """
+        Forward-Laplacian pass: propagate the value, the input gradient over idx and
+        the partial Laplacian over idx through every layer in a single forward pass.
+
+        Linear layers act linearly on all three quantities, Tanh layers apply
+        t' * lap + t'' * |grad|^2, and the hard constraint (1 - |x|^2) * nn(x) is
+        handled with the product rule.
+
+        Args:
+            x (torch.Tensor): Input tensor of shape (batch_size, dim).
+            idx: Dimensions of the partial Laplacian, all dimensions if None.
+
+        Returns:
+            tuple: Value of shape (batch_size, 1), gradient of shape (batch_size, len(idx))
+                and partial Laplacian of shape (batch_size,).
+        """
+        if idx is None:
+            idx = torch.arange(x.size(1), device=x.device)
+        idx = torch.as_tensor(idx, dtype=torch.int64, device=x.device).reshape(-1)
+
+        layers = list(self.nn)
+        h = layers[0](x)  # (batch_size, width)
+        grad = layers[0].weight[:, idx].T  # (len(idx), width), the same for every point
+        lap = None
+        for layer in layers[1:]:
+            if isinstance(layer, nn.Linear):
+                h = layer(h)
+                grad = grad @ layer.weight.T
+                lap = None if lap is None else lap @ layer.weight.T
+            else:
+                t = torch.tanh(h)
+                dt = 1 - t**2
+                d2t = -2 * t * dt
+                lap_t = d2t * torch.sum(grad**2, dim=-2)
+                lap = lap_t if lap is None else dt * lap + lap_t
+                grad = dt.unsqueeze(1) * grad  # (batch_size, len(idx), width)
+                h = t
+        nn_x = h  # (batch_size, 1)
+        nn_grad = grad.expand(x.size(0), -1, -1).squeeze(-1)  # (batch_size, len(idx))
+        nn_lap = (torch.zeros_like(nn_x) if lap is None else lap).squeeze(-1)  # (batch_size,)
+
+        x_idx = x[:, idx]
+        factor = 1 - torch.sum(x**2, 1, keepdims=True)
+        u = factor * nn_x
+        u_x = -2 * x_idx * nn_x + factor * nn_grad
+        u_lap = -2 * idx.numel() * nn_x.squeeze(-1) - 4 * torch.sum(x_idx * nn_grad, 1) + factor.squeeze(-1) * nn_lap
+        return u, u_x, u_lap
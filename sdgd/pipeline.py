@@ -0,0 +1,105 @@
+import threading
+
+import numpy as np
+import torch
+
+
+def batch_seed(seed, batch):
+    """
+    Seed of a given batch, independent of which worker draws it.
+
+    Args:
+        seed (int): Run seed.
+        batch (int): Batch index.
+
+    Returns:
+        int: 63-bit seed for a torch.Generator.
+    """
+    return int(np.random.SeedSequence([seed, batch]).generate_state(1, dtype=np.uint64)[0] >> np.uint64(1))
+
+
+class PrefetchSampler:
+    """
+    Producer/consumer pipeline that keeps a bounded number of collocation batches ready.
+
+    Worker threads each own a sampler created by make_sampler (for instance a
+    TwoBodyPoissonSampler on the CPU) and claim batch indices from a shared counter.
+    Batch b is always drawn from a generator seeded with batch_seed(seed, b) and
+    batches are handed out in index order, so the sequence of batches does not depend
+    on num_workers. Batches are pinned when the target device is a GPU and are
+    consumed without a copy on the CPU.
+    """
+
+    def __init__(self, make_sampler, num_workers=1, depth=4, seed=0, device=None, start=0):
+        self.depth = depth
+        self.seed = seed
+        self.device = torch.device(device) if device is not None else torch.device("cpu")
+        self._pin_memory = self.device.type == "cuda"
+        self._next_claim = start
+        self._next_batch = start
+        self._ready = {}
+        self._error = None
+        self._closed = False
+        self._cond = threading.Condition()
+        self._threads = [
+            threading.Thread(target=self._worker, args=(make_sampler(),), daemon=True)
+            for _ in range(num_workers)
+        ]
+        for thread in self._threads:
+            thread.start()
+
+    @property
+    def batch_index(self):
+        """Index of the next batch returned by next."""
+        return self._next_batch
+
+    def _worker(self, sampler):
+        generator = torch.Generator(device=sampler.device)
+        while True:
+            with self._cond:
+                while not self._closed and self._next_claim >= self._next_batch + self.depth:
+                    self._cond.wait()
+                if self._closed:
+                    return
+                batch = self._next_claim
+                self._next_claim += 1
+            try:
+                generator.manual_seed(batch_seed(self.seed, batch))
+                xf, ff = sampler.sample(generator)
+                xf, ff = xf.detach().clone(), ff.clone()
+                if self._pin_memory:
+                    xf, ff = xf.pin_memory(), ff.pin_memory()
+            except Exception as e:
+                with self._cond:
+                    self._error = e
+                    self._cond.notify_all()
+                return
+            with self._cond:
+                self._ready[batch] = (xf, ff)
+                self._cond.notify_all()
+
+    def next(self):
+        """
+        Get the next batch, blocking until a worker has produced it.
+
+        Returns:
+            tuple: Points of shape (N_f, dim) requiring grad and forcing of shape (N_f,).
+        """
+        with self._cond:
+            while self._next_batch not in self._ready:
+                if self._error is not None:
+                    raise RuntimeError("collocation worker failed") from self._error
+                self._cond.wait()
+            xf, ff = self._ready.pop(self._next_batch)
+            self._next_batch += 1
+            self._cond.notify_all()
+        xf = xf.to(self.device, non_blocking=True).requires_grad_()
+        ff = ff.to(self.device, non_blocking=True)
+        return xf, ff
+
+    def close(self):
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        for thread in self._threads:
+            thread.join()
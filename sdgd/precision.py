@@ -0,0 +1,46 @@
+import contextlib
+
+import torch
+
+
+PRECISIONS = ["float32", "bf16", "float64"]
+
+
+class PrecisionPolicy:
+    """
+    Dtypes of a training run.
+
+    "float32" is the plain run. "bf16" keeps the parameters, the collocation points
+    and the test set in float32 but runs the network and its input derivatives under
+    bfloat16 autocast on the device, so that the matmuls of the Linear and KANLinear
+    layers read and write half as many bytes; the residual and the loss are
+    accumulated in float32. "float64" runs everything in double precision and serves
+    as the accuracy reference of the two others.
+    """
+
+    def __init__(self, name="float32", device=None):
+        if name not in PRECISIONS:
+            raise ValueError("Unknown precision %s, expected one of %s" % (name, PRECISIONS))
+        self.name = name
+        self.device = torch.device(device) if device is not None else torch.device("cpu")
+        self.dtype = torch.float64 if name == "float64" else torch.float32
+
+    def autocast(self):
+        """
+        Returns:
+            Context manager of the network evaluations, a no-op unless "bf16".
+        """
+        if self.name != "bf16":
+            return contextlib.nullcontext()
+        return torch.autocast(self.device.type, dtype=torch.bfloat16)
+
+    def accumulate(self, x: torch.Tensor):
+        """
+        Cast a network output to the accumulation dtype of the residual and loss.
+        """
+        return x.to(self.dtype)
+
+    def __str__(self):
+        if self.name == "bf16":
+            return "bf16 autocast, %s accumulation" % str(self.dtype).split(".")[-1]
+        return self.name
@@ -0,0 +1,158 @@
+import contextlib
+import csv
+import os
+import resource
+import time
+from collections import defaultdict
+
+import torch
+
+
+_active = None
+
+
+def phase(name):
+    """
+    Time the enclosed block as one call of phase name on the active PhaseProfiler.
+    Without an active profiler this is a shared no-op context manager, so the
+    instrumentation can stay in the hot path of the trainers and of sdgd.hessian. Code
+    traced by torch.compile is never timed.
+
+    Args:
+        name (str): Phase name, for instance "resample", "hvp" or "backward".
+    """
+    if _active is None or torch.compiler.is_compiling():
+        return contextlib.nullcontext()
+    return _active.phase(name)
+
+
+class PhaseProfiler:
+    """
+    Wall-clock time per training phase, peak memory and an optional torch.profiler
+    trace of a window of steps.
+
+    Phases are timed with time.perf_counter, after a torch.cuda.synchronize() on
+    CUDA devices so that asynchronous kernels are charged to the phase that launched
+    them. The time of a phase includes the phases it encloses, shares are relative to
+    the time spent in outermost phases. Peak memory is the peak resident set size of the process
+    and, on CUDA, the peak allocated device memory; tracemalloc is not used since it
+    does not see the torch allocator.
+    """
+
+    def __init__(self, device=None, trace_path=None, trace_start=10, trace_steps=0):
+        self.device = torch.device(device) if device is not None else torch.device("cpu")
+        self.sync = self.device.type == "cuda"
+        self.trace_path = trace_path
+        self.trace_start = trace_start
+        self.trace_steps = trace_steps
+        self.totals = defaultdict(float)
+        self.counts = defaultdict(int)
+        self.outer_total = 0.0
+        self._depth = 0
+        self._trace = None
+
+    def start(self):
+        """
+        Make this profiler the target of phase().
+        """
+        global _active
+        _active = self
+
+    def stop(self):
+        global _active
+        _active = None
+        if self._trace is not None:
+            self._stop_trace()
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    @contextlib.contextmanager
+    def phase(self, name):
+        if self.sync:
+            torch.cuda.synchronize(self.device)
+        record = torch.profiler.record_function(name) if self._trace is not None else contextlib.nullcontext()
+        start = time.perf_counter()
+        self._depth += 1
+        try:
+            with record:
+                yield
+        finally:
+            self._depth -= 1
+        if self.sync:
+            torch.cuda.synchronize(self.device)
+        elapsed = time.perf_counter() - start
+        self.totals[name] += elapsed
+        self.counts[name] += 1
+        if self._depth == 0:
+            self.outer_total += elapsed
+
+    def step(self, n):
+        """
+        Mark the start of training step n, which opens and closes the trace window.
+        """
+        if _active is not self or not self.trace_steps or self.trace_path is None:
+            return
+        if n == self.trace_start:
+            activities = [torch.profiler.ProfilerActivity.CPU]
+            if self.device.type == "cuda":
+                activities.append(torch.profiler.ProfilerActivity.CUDA)
+            self._trace = torch.profiler.profile(activities=activities)
+            self._trace.__enter__()
+        elif n == self.trace_start + self.trace_steps and self._trace is not None:
+            self._stop_trace()
+
+    def _stop_trace(self):
+        self._trace.__exit__(None, None, None)
+        self._trace.export_chrome_trace(self.trace_path)
+        self._trace = None
+
+    def peak_memory(self):
+        """
+        Returns:
+            dict: Peak RSS and, on CUDA, peak allocated device memory in MB.
+        """
+        # ru_maxrss is in kB on Linux
+        memory = {"peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024}
+        if self.device.type == "cuda":
+            memory["peak_cuda_mb"] = torch.cuda.max_memory_allocated(self.device) / 2**20
+        return memory
+
+    def summary(self):
+        """
+        Returns:
+            list: One row (phase, calls, total_s, mean_ms, share) per phase, by
+                decreasing total time, the share being relative to the time spent
+                in outermost phases.
+        """
+        total = self.outer_total or 1.0
+        rows = []
+        for name in sorted(self.totals, key=self.totals.get, reverse=True):
+            rows.append([name, self.counts[name], self.totals[name], 1e3 * self.totals[name] / self.counts[name], self.totals[name] / total])
+        return rows
+
+    def report(self, path=None):
+        """
+        Print the summary table and the peak memory, and write both to path as CSV.
+        """
+        rows = self.summary()
+        memory = self.peak_memory()
+        print("%-20s %8s %10s %10s %7s" % ("phase", "calls", "total (s)", "mean (ms)", "share"))
+        for name, calls, total, mean, share in rows:
+            print("%-20s %8d %10.3f %10.3f %6.1f%%" % (name, calls, total, mean, 100 * share))
+        print(", ".join("%s: %.1f" % item for item in memory.items()))
+        if path is None:
+            return
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with open(path, "w", newline="") as f:
+            writer = csv.writer(f)
+            writer.writerow(["phase", "calls", "total_s", "mean_ms", "share"])
+            writer.writerows(rows)
+            for name, value in memory.items():
+                writer.writerow([name, "", value, "", ""])
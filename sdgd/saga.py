@@ -0,0 +1,98 @@
+import numpy as np
+import torch
+
+
+STORAGE_DTYPES = {"float32": torch.float32, "float16": torch.float16, "bfloat16": torch.bfloat16}
+
+
+class SAGATable:
+    """
+    SAGA gradient memory stored as a single contiguous (num_slots, num_params) tensor.
+
+    The .grad of every parameter is replaced by a view into one flat buffer, so after
+    loss.backward() the live gradient is available as self.flat_grad without copies.
+    The optimizer must then reset gradients with zero_grad(set_to_none=False) to
+    keep the views. The table may be stored in a lower precision or, when it does not
+    fit in memory, in a np.memmap backed file; the running mean and the update are
+    always computed in the parameter dtype.
+    """
+
+    def __init__(self, params, num_slots, storage_dtype="float32", memmap_path=None):
+        self.params = list(params)
+        self.num_slots = num_slots
+        num_params = sum(p.numel() for p in self.params)
+        device, dtype = self.params[0].device, self.params[0].dtype
+
+        self.flat_grad = torch.zeros(num_params, dtype=dtype, device=device)
+        offset = 0
+        for p in self.params:
+            p.grad = self.flat_grad[offset : offset + p.numel()].view_as(p)
+            offset += p.numel()
+        self.mean = torch.zeros(num_params, dtype=dtype, device=device)
+
+        storage_dtype = STORAGE_DTYPES[storage_dtype]
+        self.memmap = None
+        if memmap_path:
+            if device.type != "cpu" or storage_dtype == torch.bfloat16:
+                raise ValueError("memmap SAGA storage needs a CPU model and a float32/float16 table")
+            table = np.lib.format.open_memmap(
+                memmap_path, mode="w+", dtype=np.dtype(str(storage_dtype).split(".")[-1]), shape=(num_slots, num_params)
+            )
+            self.memmap = table
+            self.table = torch.from_numpy(table)
+        else:
+            self.table = torch.zeros(num_slots, num_params, dtype=storage_dtype, device=device)
+
+    def flush(self):
+        """
+        Write the memmap table to its file, a no-op for an in-memory table.
+        """
+        if self.memmap is not None:
+            self.memmap.flush()
+
+    def load_table(self, path, chunk_size=4096):
+        """
+        Fill the table from a .npy file, such as the copy of a memmap table kept with a
+        checkpoint, a chunk of rows at a time so that the file is never fully loaded.
+
+        Args:
+            path (str): .npy file of shape (num_slots, num_params).
+            chunk_size (int): Rows copied at once.
+        """
+        source = np.load(path, mmap_mode="r")
+        if source.shape != tuple(self.table.shape):
+            raise ValueError("%s holds a %s SAGA table, expected %s" % (path, source.shape, tuple(self.table.shape)))
+        for start in range(0, self.num_slots, chunk_size):
+            rows = np.ascontiguousarray(source[start : start + chunk_size])
+            self.table[start : start + len(rows)] = torch.from_numpy(rows).to(self.table.dtype)
+
+    def step(self, slot):
+        """
+        Replace the live gradient of slot by its SAGA estimate g - table[slot] + mean,
+        then update the running mean and the table.
+
+        Args:
+            slot (int): Table slot of the live gradient.
+        """
+        g = self.flat_grad
+        diff = g - self.table[slot].to(g.dtype)
+        self.table[slot] = g
+        torch.add(diff, self.mean, out=g)
+        self.mean.add_(diff, alpha=1.0 / self.num_slots)
+
+    def step_batched(self, grads: torch.Tensor, slots):
+        """
+        SAGA step for several sampled slots at once: the live gradient is set to
+        mean_j (grads[j] - table[slot_j]) + mean and all sampled slots of the table
+        and the running mean are updated together.
+
+        Args:
+            grads (torch.Tensor): SAGA components of the sampled slots of shape
+                (num_sampled, num_params).
+            slots: Distinct table slots of shape (num_sampled,).
+        """
+        slots = torch.as_tensor(slots, dtype=torch.int64, device=self.table.device)
+        diff = grads - self.table[slots].to(grads.device, grads.dtype)
+        self.table[slots] = grads.to(self.table.device, self.table.dtype)
+        torch.add(diff.mean(0), self.mean, out=self.flat_grad)
+        self.mean.add_(diff.sum(0), alpha=1.0 / self.num_slots)
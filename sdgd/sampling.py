@@ -0,0 +1,155 @@
+import numpy as np
+import torch
+
+
+class TwoBodyPoissonSampler:
+    """
+    Draw collocation points uniformly in radius inside the ball of radius x_radius and
+    evaluate the forcing of the two-body Poisson problem, entirely in torch on the
+    training device and dtype.
+
+    The exact solution is u = u1 * u2 with u1 = x_radius^2 - |x|^2 and
+    u2 = sum_j c_j sin(a_j), a_j = x_j + const_2 * cos(x_{j+1}) + x_{j+1} * cos(x_j).
+    Each trigonometric subexpression is computed once per call and all outputs are
+    written into preallocated buffers, so the returned tensors are only valid until
+    the next call of sample.
+    """
+
+    def __init__(self, c, N_f, x_radius=1.0, const_2=1, device=None, dtype=torch.float32, seed=0):
+        self.c = torch.as_tensor(c, dtype=dtype, device=device).reshape(1, -1)  # (1, dim - 1)
+        self.dim = self.c.size(1) + 1
+        self.N_f = N_f
+        self.x_radius = x_radius
+        self.const_2 = const_2
+        self.device = torch.device(device) if device is not None else self.c.device
+        self.dtype = dtype
+        self.generator = torch.Generator(device=self.device).manual_seed(seed)
+
+        self._x = torch.empty(N_f, self.dim, dtype=dtype, device=self.device)
+        self._r = torch.empty(N_f, 1, dtype=dtype, device=self.device)
+        self._ff = torch.empty(N_f, dtype=dtype, device=self.device)
+        # sin(x1), cos(x1), sin(x2), cos(x2), sin(a), cos(a) for x1 = x[:, :-1], x2 = x[:, 1:]
+        self._trig = torch.empty(6, N_f, self.dim - 1, dtype=dtype, device=self.device)
+
+    def forcing(self, x: torch.Tensor, out=None):
+        """
+        Evaluate the Laplacian of the exact solution.
+
+        Args:
+            x (torch.Tensor): Input tensor of shape (N_f, dim).
+            out (torch.Tensor): Optional output tensor of shape (N_f,).
+
+        Returns:
+            torch.Tensor: Forcing tensor of shape (N_f,).
+        """
+        k = self.const_2
+        x1, x2 = x[:, :-1], x[:, 1:]
+        trig = self._trig if x.size(0) == self.N_f else x.new_empty(6, x.size(0), self.dim - 1)
+        sin_x1, cos_x1, sin_x2, cos_x2, sin_a, cos_a = trig
+        torch.sin(x1, out=sin_x1)
+        torch.cos(x1, out=cos_x1)
+        torch.sin(x2, out=sin_x2)
+        torch.cos(x2, out=cos_x2)
+        a = x1 + k * cos_x2 + x2 * cos_x1
+        torch.sin(a, out=sin_a)
+        torch.cos(a, out=cos_a)
+
+        da_dx1 = 1 - x2 * sin_x1
+        da_dx2 = -k * sin_x2 + cos_x1
+        u1 = self.x_radius**2 - torch.sum(x**2, 1)
+        u2 = torch.sum(self.c * sin_a, 1)
+        # sum_i d2u2/dxi2 and sum_i xi * du2/dxi
+        lap_u2 = torch.sum(
+            self.c * (-sin_a * (da_dx1**2 + da_dx2**2) - cos_a * (x2 * cos_x1 + k * cos_x2)), 1
+        )
+        x_grad_u2 = torch.sum(self.c * cos_a * (x1 * da_dx1 + x2 * da_dx2), 1)
+        # Laplacian of u1 * u2 with grad u1 = -2x and Laplacian of u1 = -2 * dim
+        ff = u1 * lap_u2 - 4 * x_grad_u2 - 2 * self.dim * u2
+        if out is None:
+            return ff
+        return out.copy_(ff)
+
+    def sample(self, generator=None):
+        """
+        Draw a new batch of collocation points and their forcing.
+
+        Args:
+            generator (torch.Generator): Source of randomness, self.generator if None.
+
+        Returns:
+            tuple: Points of shape (N_f, dim) requiring grad and forcing of shape (N_f,).
+        """
+        generator = self.generator if generator is None else generator
+        x, r = self._x, self._r
+        torch.randn(x.shape, generator=generator, dtype=self.dtype, device=self.device, out=x)
+        torch.rand(r.shape, generator=generator, dtype=self.dtype, device=self.device, out=r)
+        r.mul_(self.x_radius).div_(torch.linalg.vector_norm(x, dim=1, keepdim=True))
+        x.mul_(r)
+        self.forcing(x, out=self._ff)
+        return x.detach().requires_grad_(), self._ff
+
+
+class DimensionSampler:
+    """
+    Importance sampling of the dimensions of the SDGD Laplacian estimate.
+
+    Keeps a running RMS over the collocation points of every d2u/dxi2 and draws
+    batch_size dimensions with replacement with probabilities
+
+        p_i = (1 - floor) * s_i / sum_j s_j + floor / dim,
+
+    the floor keeping every dimension in play while its estimate is stale. The
+    weights 1 / (batch_size * p_i) make sum_k w_k * d2u/dx_{i_k}2 an unbiased
+    estimate of the full Laplacian; with uniform probabilities they reduce to the
+    dim / batch_size of plain SDGD. Dimensions that were never drawn use the mean of
+    the visited ones, so the first draws are uniform. The draws use the global NumPy
+    stream, like the uniform np.random.choice they replace.
+    """
+
+    def __init__(self, dim, batch_size, floor=0.1, momentum=0.9):
+        if not 0 < floor <= 1:
+            raise ValueError("floor must be in (0, 1], got %g" % floor)
+        self.dim = dim
+        self.batch_size = batch_size
+        self.floor = floor
+        self.momentum = momentum
+        self.scale = np.full(dim, np.nan)  # running RMS of d2u/dxi2, nan until dimension i is drawn
+
+    @property
+    def probs(self):
+        visited = ~np.isnan(self.scale)
+        if not visited.any():
+            return np.full(self.dim, 1.0 / self.dim)
+        scale = np.where(visited, self.scale, self.scale[visited].mean())
+        total = scale.sum()
+        if total <= 0:
+            return np.full(self.dim, 1.0 / self.dim)
+        return (1 - self.floor) * scale / total + self.floor / self.dim
+
+    def sample(self):
+        """
+        Returns:
+            tuple: Sampled dimensions of shape (batch_size,), possibly repeated, and
+                their importance weights of shape (batch_size,).
+        """
+        probs = self.probs
+        idx = np.random.choice(self.dim, self.batch_size, replace=True, p=probs)
+        return idx, 1.0 / (self.batch_size * probs[idx])
+
+    def update(self, idx, u_xx: torch.Tensor):
+        """
+        Fold the Hessian diagonal entries of the last draw into the running estimate.
+
+        Args:
+            idx (np.ndarray): Dimensions returned by sample.
+            u_xx (torch.Tensor): d2u/dxi2 at the collocation points, of shape (N_f, batch_size).
+        """
+        rms = u_xx.detach().float().square().mean(0).sqrt().cpu().numpy()
+        old = self.scale[idx]
+        self.scale[idx] = np.where(np.isnan(old), rms, self.momentum * old + (1 - self.momentum) * rms)
+
+    def state_dict(self):
+        return {"scale": self.scale.copy()}
+
+    def load_state_dict(self, state):
+        self.scale = state["scale"].copy()